@@ -0,0 +1,50 @@
+import streamlit as st
+import base64
+import io
+import json
+import os
+from PIL import Image
+
+MAN_AVATAR_PATH = 'assets/man.png'
+WOMAN_AVATAR_PATH = 'assets/woman.png'
+EMOJIS_PATH = 'emojis.json'
+# Avatars are shown at 40px, the thumbnails are twice that for high-density screens
+AVATAR_SIZE = 80
+
+# The loaders are cached once per process and keyed on the file's mtime,
+# so an edited asset is picked up without restarting the app
+@st.cache_resource(show_spinner=False)
+def _load_emojis(path, mtime):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+@st.cache_resource(show_spinner=False)
+def _load_thumbnail_base64(path, size, mtime):
+    with Image.open(path) as image:
+        image.thumbnail((size, size))
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG", optimize=True)
+    return base64.b64encode(buffer.getvalue()).decode()
+
+def get_thumbnail_base64(path, size=AVATAR_SIZE):
+    return _load_thumbnail_base64(path, size, os.path.getmtime(path))
+
+def read_emojis(path=EMOJIS_PATH):
+    return _load_emojis(path, os.path.getmtime(path))
+
+@st.cache_resource(show_spinner=False)
+def _build_avatar_css(man_mtime, woman_mtime):
+    # The full-size pictures are megabytes of base64, only small thumbnails are inlined
+    man_img_base64 = get_thumbnail_base64(MAN_AVATAR_PATH)
+    woman_img_base64 = get_thumbnail_base64(WOMAN_AVATAR_PATH)
+    return (
+        "<style>"
+        ".chat-avatar {border-radius: 50%; width: 40px; height: 40px; flex-shrink: 0; background-size: cover; background-position: center;}"
+        f".chat-avatar-user {{background-image: url('data:image/png;base64,{man_img_base64}');}}"
+        f".chat-avatar-chatter {{background-image: url('data:image/png;base64,{woman_img_base64}');}}"
+        "</style>"
+    )
+
+def avatar_css():
+    # The avatars are inlined once per page as shared CSS classes instead of once per message
+    return _build_avatar_css(os.path.getmtime(MAN_AVATAR_PATH), os.path.getmtime(WOMAN_AVATAR_PATH))
@@ -0,0 +1,129 @@
+import streamlit as st
+import functools
+import os
+import threading
+import time
+import requests
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from io import BytesIO
+
+# Largest audio file accepted from a URL, in bytes
+MAX_AUDIO_BYTES = 25 * 1024 * 1024
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+# Cached downloads are used as is for this many seconds before being revalidated
+REVALIDATE_AFTER = 60
+# Total size of the downloads kept in memory, in bytes
+MAX_CACHED_BYTES = 64 * 1024 * 1024
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+
+class AudioFetchError(Exception):
+    pass
+
+class AudioFetcher:
+    # Downloads audio files with timeouts and a size cap, caching them by URL and
+    # revalidating with ETag / Last-Modified instead of downloading them again
+    def __init__(self, max_bytes=MAX_AUDIO_BYTES, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+                 revalidate_after=REVALIDATE_AFTER, max_cached_bytes=MAX_CACHED_BYTES):
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.revalidate_after = revalidate_after
+        self.max_cached_bytes = max_cached_bytes
+        self.http = requests.Session()
+        self.cache = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def cached(self, url):
+        with self.lock:
+            entry = self.cache.get(url)
+            if entry is not None:
+                self.cache.move_to_end(url)
+            return entry
+
+    def remember(self, url, entry):
+        with self.lock:
+            if url in self.cache:
+                self.size -= len(self.cache.pop(url)['content'])
+            self.cache[url] = entry
+            self.size += len(entry['content'])
+            # Least recently used downloads go first, the newest one is always kept
+            while self.size > self.max_cached_bytes and len(self.cache) > 1:
+                self.size -= len(self.cache.popitem(last=False)[1]['content'])
+
+    def download(self, response):
+        length = response.headers.get('Content-Length')
+        if length is not None and int(length) > self.max_bytes:
+            raise AudioFetchError(f"The audio file is larger than the {self.max_bytes} byte limit")
+        buffer = bytearray()
+        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_BYTES):
+            buffer.extend(chunk)
+            if len(buffer) > self.max_bytes:
+                raise AudioFetchError(f"The audio file is larger than the {self.max_bytes} byte limit")
+        return bytes(buffer)
+
+    def fetch(self, url):
+        entry = self.cached(url)
+        if entry is not None and time.monotonic() - entry['checked'] < self.revalidate_after:
+            return BytesIO(entry['content'])
+        headers = {}
+        if entry is not None:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+        try:
+            with self.http.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+                if response.status_code == 304 and entry is not None:
+                    self.remember(url, {**entry, 'checked': time.monotonic()})
+                    return BytesIO(entry['content'])
+                if response.status_code != 200:
+                    raise AudioFetchError(f"Could not download the audio file: HTTP {response.status_code}")
+                content = self.download(response)
+                self.remember(url, {
+                    'content': content,
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'checked': time.monotonic(),
+                })
+                return BytesIO(content)
+        except requests.RequestException as e:
+            raise AudioFetchError(f"Could not download the audio file: {e}")
+
+@st.cache_resource(show_spinner=False)
+def get_audio_fetcher():
+    return AudioFetcher()
+
+def fetch_audio_url(audio_url):
+    # Returns the audio as BytesIO, or None after reporting the error in the sidebar
+    try:
+        return get_audio_fetcher().fetch(audio_url)
+    except AudioFetchError as e:
+        st.sidebar.error(str(e))
+        return None
+
+class LocalAudioServer:
+    # Local HTTP stand-in serving a directory of audio files, with Last-Modified
+    # support, to try the URL input without a remote host
+    def __init__(self, directory='assets', host='127.0.0.1', port=0):
+        handler = functools.partial(SimpleHTTPRequestHandler, directory=directory)
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def url(self, filename):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/{filename}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+if __name__ == "__main__":
+    with LocalAudioServer(port=int(os.environ.get("AUDIO_SERVER_PORT", 8502))) as server:
+        print(f"Serving assets at {server.url('')}")
+        server.thread.join()
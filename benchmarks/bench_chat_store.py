@@ -0,0 +1,66 @@
+import os
+import sys
+import time
+import statistics
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chat_store import ChatStore, COLUMNS
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+# The legacy to_dict/rebuild path is too slow to sample past this size
+LEGACY_MAX_SIZE = 100_000
+SENDS = 20
+
+def make_history(size):
+    return pd.DataFrame({
+        'MNDName': [f"user{i % 100}" for i in range(size)],
+        'Chatter': [f"chatter{i % 1000}" for i in range(size)],
+        'Tag': ["friend"] * size,
+        'SubTag': ["school"] * size,
+        'Timestamp': ["2024-01-01 12:00:00"] * size,
+        'Message': [f"message {i}" for i in range(size)],
+        'Sender': [f"user{i % 100}" for i in range(size)],
+    }, columns=COLUMNS)
+
+def new_chat(i):
+    return {'MNDName': "user0", 'Chatter': "chatter0", 'Tag': "friend", 'SubTag': "school",
+            'Timestamp': "2024-01-01 12:00:00", 'Message': f"new message {i}", 'Sender': "user0"}
+
+def bench_store(df):
+    store = ChatStore(df)
+    latencies = []
+    for i in range(SENDS):
+        start = time.perf_counter()
+        store.append(new_chat(i))
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies)
+
+def bench_legacy(df):
+    latencies = []
+    for i in range(SENDS):
+        start = time.perf_counter()
+        current_record = df.to_dict('records')
+        current_record.append(new_chat(i))
+        df = pd.DataFrame(current_record)
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies)
+
+def legacy_bytes(df):
+    # Object columns as the store kept them before: one pointer per cell plus each
+    # distinct Python object they point to
+    columns = [df[column].to_numpy(dtype=object) for column in COLUMNS]
+    objects = {id(value): sys.getsizeof(value) for values in columns for value in values}
+    return len(df) * len(COLUMNS) * 8 + sum(objects.values())
+
+def main():
+    print(f"{'rows':>10} {'store send (us)':>16} {'legacy send (us)':>17} {'store B/row':>12} {'legacy B/row':>13}")
+    for size in SIZES:
+        df = make_history(size)
+        store_latency = bench_store(df) * 1e6
+        legacy_latency = f"{bench_legacy(df) * 1e6:17.1f}" if size <= LEGACY_MAX_SIZE else f"{'-':>17}"
+        store_bytes = ChatStore(df).memory_usage() / size
+        print(f"{size:>10} {store_latency:16.1f} {legacy_latency} {store_bytes:12.1f} {legacy_bytes(df) / size:13.1f}")
+
+if __name__ == "__main__":
+    main()
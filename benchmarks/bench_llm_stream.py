@@ -0,0 +1,42 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_stream import FakeLlamaAPI, iter_stream_tokens, strip_quotes, strip_quotes_stream
+
+REPLY_WORDS = [20, 100, 400]
+TOKEN_DELAY = 0.005
+FIRST_TOKEN_DELAY = 0.1
+
+def make_request():
+    return {"model": "llama-7b-chat", "messages": [{"role": "user", "content": "hello"}]}
+
+def bench_sync(llama):
+    start = time.perf_counter()
+    answer = strip_quotes(llama.run({**make_request(), "stream": False}).json()["choices"][0]["message"]["content"])
+    total = time.perf_counter() - start
+    return total, total, answer
+
+def bench_stream(llama):
+    start = time.perf_counter()
+    first_token = None
+    tokens = []
+    for token in strip_quotes_stream(iter_stream_tokens(llama, make_request())):
+        if first_token is None:
+            first_token = time.perf_counter() - start
+        tokens.append(token)
+    return first_token, time.perf_counter() - start, "".join(tokens)
+
+def main():
+    print(f"{'words':>6} {'mode':>7} {'first token (ms)':>17} {'total (ms)':>11}")
+    for words in REPLY_WORDS:
+        reply = '"' + " ".join(["word"] * words) + '"'
+        llama = FakeLlamaAPI(reply=reply, token_delay=TOKEN_DELAY, first_token_delay=FIRST_TOKEN_DELAY)
+        results = {"sync": bench_sync(llama), "stream": bench_stream(llama)}
+        assert results["sync"][2] == results["stream"][2]
+        for mode, (first_token, total, _) in results.items():
+            print(f"{words:>6} {mode:>7} {first_token * 1e3:17.1f} {total * 1e3:11.1f}")
+
+if __name__ == "__main__":
+    main()
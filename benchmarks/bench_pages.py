@@ -0,0 +1,195 @@
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from chat_store import COLUMNS, TIMESTAMP_FORMAT, SharedChatStore, ChatCursor
+from chat_tags import CHAT_TAGS
+
+SIZES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+PAGES = ["chat.py", "pages/chat_with_contacts.py", "pages/0_chat_with_llm.py"]
+USERS = 50
+CHATTERS = 200
+# Users and chatters are drawn with weight 1 / rank ** SKEW, 0 spreads the rows evenly
+SKEW = 1.2
+RERUNS = 5
+SENDS = 5
+BENCH_USER = "user0"
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+WORDS = ["hello", "how", "are", "you", "today", "fine", "thanks", "see", "soon", "dinner",
+         "tomorrow", "call", "me", "later", "love", "miss", "weekend", "doctor", "great", "news"]
+
+class BenchUpload:
+    # Stands in for the uploaded file chat.py remembers after an import
+    name = "chat_history.csv"
+
+def skewed_choice(rng, count, size, skew):
+    weights = 1 / np.arange(1, count + 1) ** skew
+    return rng.choice(count, size=size, p=weights / weights.sum())
+
+def make_history(rows, users=USERS, chatters=CHATTERS, skew=SKEW, seed=0):
+    rng = np.random.default_rng(seed)
+    user_names = np.array([f"user{i}" for i in range(users)], dtype=object)[skewed_choice(rng, users, rows, skew)]
+    chatter_ids = skewed_choice(rng, chatters, rows, skew)
+    chatter_names = np.array([f"chatter{i}" for i in range(chatters)], dtype=object)[chatter_ids]
+    tags = np.array(list(CHAT_TAGS), dtype=object)
+    words = np.array(WORDS, dtype=object)[rng.integers(0, len(WORDS), size=(rows, 6))]
+    timestamps = pd.Timestamp("2024-01-01") + pd.to_timedelta(np.arange(rows) * 30, unit="s")
+    return pd.DataFrame({
+        'MNDName': user_names,
+        'Chatter': chatter_names,
+        'Tag': tags[chatter_ids % len(tags)],
+        'SubTag': "bench",
+        'Timestamp': timestamps.strftime(TIMESTAMP_FORMAT),
+        'Message': [" ".join(message) for message in words],
+        'Sender': np.where(rng.random(rows) < 0.5, user_names, chatter_names),
+    }, columns=COLUMNS)
+
+def median_run(at, action=None):
+    latencies = []
+    for i in range(RERUNS if action is None else SENDS):
+        start = time.perf_counter()
+        (at if action is None else action(at, i)).run()
+        latencies.append(time.perf_counter() - start)
+        assert not at.exception, at.exception
+    return statistics.median(latencies)
+
+def send(at, i):
+    return at.chat_input[0].set_value(f"benchmark message {i} hello")
+
+def wait_for_voice(at, url, timeout=60):
+    # Transcribe a served file with the stub recognizer, rerunning like the polling fragment does
+    from audio_fetch import LocalAudioServer
+    with LocalAudioServer(directory=os.path.join(ROOT, "assets")) as server:
+        next(c for c in at.sidebar.checkbox if c.label == "Enable Voice Input").check().run()
+        next(r for r in at.sidebar.radio if r.label == "Upload audio file from:").set_value("URL").run()
+        start = time.perf_counter()
+        next(t for t in at.sidebar.text_input if t.label == "Enter audio URL:").set_value(server.url(url)).run()
+        while not any(s.value == "Transcription done" for s in at.sidebar.success):
+            if time.perf_counter() - start > timeout:
+                raise TimeoutError("voice input did not finish")
+            time.sleep(0.01)
+            at.run()
+        return time.perf_counter() - start
+
+def run_scenario(page, csv_path, voice):
+    os.environ.update({"LLAMA_FAKE_BACKEND": "1", "LLAMA_FAKE_DELAY": "0", "SPEECH_BACKEND": "stub"})
+    from streamlit.testing.v1 import AppTest
+    from chat_import import import_chat_history
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as workdir:
+        # Messages sent by the pages go to a throwaway database, the assets are linked in
+        for name in ("assets", "emojis.json"):
+            os.symlink(os.path.join(ROOT, name), os.path.join(workdir, name))
+        os.chdir(workdir)
+        start = time.perf_counter()
+        with open(csv_path, 'rb') as f:
+            shards = import_chat_history(f)
+        load = time.perf_counter() - start
+        shared = SharedChatStore()
+        shared.merge(shards)
+        at = AppTest.from_file(os.path.join(ROOT, page), default_timeout=600)
+        at.session_state['current_user'] = BENCH_USER
+        at.session_state['chat_histories'] = ChatCursor(shared, list(shards))
+        if page == "chat.py":
+            at.session_state['log_chat'] = True
+            at.session_state['chat_data'] = BenchUpload()
+        elif page == "pages/0_chat_with_llm.py":
+            at.session_state['api_key'] = "bench"
+        at.run()
+        assert not at.exception, at.exception
+        if page == "pages/0_chat_with_llm.py":
+            # The rarest chatter, rendering the whole history of a frequent one dominates everything else
+            next(t for t in at.sidebar.text_input if t.label == "Enter the chatter's name:").set_value(f"chatter{CHATTERS - 1}").run()
+        result = {
+            'page': page,
+            'load_s': load,
+            'rerun_ms': median_run(at) * 1e3,
+            'send_ms': None if page == "chat.py" else median_run(at, send) * 1e3,
+            'voice_ms': wait_for_voice(at, voice) * 1e3 if voice and page == "pages/chat_with_contacts.py" else None,
+        }
+    result['peak_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return result
+
+def git_revision():
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+        return revision + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def print_results(results, baseline=None):
+    previous = {(r['page'], r['rows']): r for r in baseline['results']} if baseline else {}
+    metrics = ['load_s', 'rerun_ms', 'send_ms', 'voice_ms', 'peak_mb']
+    print(f"{'page':<30} {'rows':>9} " + " ".join(f"{metric:>16}" for metric in metrics))
+    for result in results:
+        before = previous.get((result['page'], result['rows']), {})
+        cells = []
+        for metric in metrics:
+            value = result[metric]
+            cell = "-" if value is None else f"{value:.2f}"
+            if value is not None and before.get(metric):
+                cell += f" ({value / before[metric]:.2f}x)"
+            cells.append(f"{cell:>16}")
+        print(f"{result['page']:<30} {result['rows']:>9} " + " ".join(cells))
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive the chat pages headlessly with synthetic histories")
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=list(SIZES))
+    parser.add_argument("--pages", nargs="+", choices=PAGES, default=PAGES)
+    parser.add_argument("--users", type=int, default=USERS)
+    parser.add_argument("--chatters", type=int, default=CHATTERS)
+    parser.add_argument("--skew", type=float, default=SKEW)
+    parser.add_argument("--voice", default="tests_english.wav", help="file in assets transcribed on the contacts page, empty to skip")
+    parser.add_argument("--output", help="where to save the results, defaults to benchmarks/results/<revision>.json")
+    parser.add_argument("--compare", help="results file of an earlier run to compare against")
+    args = parser.parse_args()
+
+    revision = git_revision()
+    results = []
+    # Each scenario runs in a fresh interpreter so its peak memory is its own
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as data_dir:
+        for size in args.sizes:
+            rows = SIZES[size]
+            csv_path = os.path.join(data_dir, f"history_{size}.csv")
+            make_history(rows, args.users, args.chatters, args.skew).to_csv(csv_path, index=False)
+            for page in args.pages:
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    result = executor.submit(run_scenario, page, csv_path, args.voice).result()
+                results.append({'rows': rows, **result})
+                print(f"{page} with {rows} rows done", file=sys.stderr)
+
+    report = {
+        'revision': revision,
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'config': {'users': args.users, 'chatters': args.chatters, 'skew': args.skew, 'reruns': RERUNS, 'sends': SENDS},
+        'results': results,
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"compared with {baseline['revision']} ({baseline['date']})")
+    print_results(results, baseline)
+    output = args.output or os.path.join(RESULTS_DIR, f"{revision}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"saved to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import os
+import sys
+import time
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chat_store import ChatStore
+from bench_chat_store import make_history, new_chat
+
+SIZES = [10_000, 100_000, 1_000_000]
+QUERIES = ["message 42", "new", "chatter missing"]
+REPEATS = 5
+
+def median_time(function):
+    latencies = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        function()
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies)
+
+def main():
+    print(f"{'rows':>10} {'index build (ms)':>17} {'search (ms)':>12} {'search after send (ms)':>23} {'str.contains (ms)':>18}")
+    for size in SIZES:
+        df = make_history(size)
+        store = ChatStore(df)
+        start = time.perf_counter()
+        store.search("warm up")
+        build = time.perf_counter() - start
+        search = median_time(lambda: [store.search(query, mnd="user0") for query in QUERIES]) / len(QUERIES)
+        def send_and_search():
+            store.append(new_chat(len(store)))
+            store.search("new", mnd="user0")
+        after_send = median_time(send_and_search)
+        scan = median_time(lambda: [df[(df['MNDName'] == "user0") & df['Message'].str.contains(query, case=False)] for query in QUERIES]) / len(QUERIES)
+        print(f"{size:>10} {build * 1e3:17.1f} {search * 1e3:12.2f} {after_send * 1e3:23.2f} {scan * 1e3:18.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPEATS = 5
+MODULES = ["chat_components", "chat_store", "speech_to_text", "audio_fetch", "llm_client", "llm_cache", "llm_async"]
+PAGES = ["chat.py", "pages/chat_with_contacts.py", "pages/0_chat_with_llm.py"]
+
+IMPORT_SCRIPT = """
+import time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+# First run of a page in a fresh interpreter, including the imports it triggers
+COLD_START_SCRIPT = """
+import time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+ready = time.perf_counter()
+at = AppTest.from_file({page!r}, default_timeout=60)
+at.session_state['current_user'] = "bench"
+at.run()
+assert not at.exception, at.exception
+print(time.perf_counter() - ready)
+"""
+
+def run_fresh(script):
+    samples = []
+    for _ in range(REPEATS):
+        output = subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        samples.append(float(output.strip().splitlines()[-1]))
+    return statistics.median(samples)
+
+def main():
+    print(f"{'module import':<32} {'ms':>8}")
+    for module in MODULES:
+        print(f"{module:<32} {run_fresh(IMPORT_SCRIPT.format(module=module)) * 1e3:8.1f}")
+    print()
+    print(f"{'page cold start':<32} {'ms':>8}")
+    for page in PAGES:
+        print(f"{page:<32} {run_fresh(COLD_START_SCRIPT.format(page=os.path.join(ROOT, page))) * 1e3:8.1f}")
+
+if __name__ == "__main__":
+    main()
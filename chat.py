@@ -1,6 +1,9 @@
 import streamlit as st
-import pandas as pd
-import base64
+from chat_store import ChatCursor, get_shared_chat_store, get_chat_store
+from chat_import import import_chat_history, ChatImportError
+from chat_export import EXPORT_FORMATS, available_formats, export_bytes, export_file_name
+from chat_persistence import get_chat_database, load_persisted_history
+from perf import timed, perf_panel
 
 # Initialize session state
 if 'current_user' not in st.session_state:
@@ -10,19 +13,13 @@ if 'log_chat' not in st.session_state:
 if 'chat_data' not in st.session_state:
     st.session_state['chat_data'] = None
 if 'chat_histories' not in st.session_state:
-    st.session_state['chat_histories'] = pd.DataFrame(columns=['MNDName', 'Chatter', 'Tag', 'SubTag', 'Timestamp', 'Message', 'Sender'])
+    st.session_state['chat_histories'] = ChatCursor(get_shared_chat_store())
 
 # Hangle login
 def login():
     st.session_state['current_user'] = st.text_input("Enter MND patient's name to login:")
     if st.button("Login"):
-        st.experimental_rerun()
-
-# Function to convert DataFrame to CSV and then encode it to base64
-def convert_df_to_csv_base64(df):
-    csv_file = df.to_csv(index=False).encode('utf-8')
-    b64 = base64.b64encode(csv_file).decode()
-    return b64
+        st.rerun()
 
 # Check if user is logged in
 if not st.session_state['current_user']:
@@ -39,22 +36,49 @@ else:
         st.markdown("* `MNDName`, `Chatter`, `Tag`, `SubTag`, `Timestamp`, `Message`, `Sender`")
         chat_data = st.file_uploader("Upload chat history file:", type=['csv'])
         
+        only_own_chats = st.checkbox("Only load my own chats", help="Rows of other MND patients in the file are skipped, and are not part of the downloaded file.")
+        
         # Update session state only if new file is uploaded
         if chat_data is not None and chat_data != st.session_state['chat_data']:
             st.session_state['chat_data'] = chat_data
             if chat_data.size > 0:
+                progress_bar = st.progress(0.0, text="Loading chat history...")
                 try:
-                    data_df = pd.read_csv(chat_data)
-                    if not data_df.empty and data_df.columns.tolist() == ['MNDName', 'Chatter', 'Tag', 'SubTag', 'Timestamp', 'Message', 'Sender']:
-                        st.session_state['chat_histories'] = data_df
-                    else:
-                        st.warning("The uploaded CSV file does not have the correct columns, the original content will be replaced!")
-                except pd.errors.EmptyDataError:
-                    st.warning("The uploaded CSV file is empty!")
+                    # Read the file in chunks straight into the shared chat store
+                    with timed('csv_load') as sample:
+                        shards = import_chat_history(
+                            chat_data,
+                            user=st.session_state['current_user'] if only_own_chats else None,
+                            progress=lambda done: progress_bar.progress(done, text="Loading chat history..."),
+                        )
+                        sample['rows'] = sum(len(shard) for shard in shards.values())
+                    get_shared_chat_store().merge(shards)
+                    st.session_state['chat_histories'] = ChatCursor(get_shared_chat_store(), list(shards))
+                except ChatImportError as e:
+                    st.warning(str(e))
+                progress_bar.empty()
 
         # Provide a download button if chat_histories is available
         if st.session_state['chat_data'] and st.session_state['chat_histories'] is not None:
-            file_base64 = convert_df_to_csv_base64(st.session_state['chat_histories'])
-            href = f'<a href="data:file/csv;base64,{file_base64}" download="updated_{st.session_state["chat_data"].name}">Download updated chat history file</a>'
-            st.markdown(href, unsafe_allow_html=True)
+            store = get_chat_store()
+            database = get_chat_database()
+            export_format = st.selectbox("Download format:", available_formats())
+            export_scope = st.radio("Chats to download:", ("All chats", "My chats", "One tag"), horizontal=True)
+            # Tags of conversations only saved on disk so far are offered without loading them
+            export_tag = st.selectbox("Tag:", list(dict.fromkeys(store.tags() + database.tags(store.users)))) if export_scope == "One tag" else None
+            export_user = st.session_state['current_user'] if export_scope == "My chats" else None
+
+            def export_data():
+                # Conversations only saved on disk so far are loaded when the file is generated
+                load_persisted_history(store, database)
+                return export_bytes(store.select(mnd=export_user, tag=export_tag), export_format)
+
+            # The file is only generated when the button is clicked
+            st.download_button(
+                "Download updated chat history file",
+                data=export_data,
+                file_name=export_file_name(st.session_state["chat_data"].name, export_format),
+                mime=EXPORT_FORMATS[export_format]['mime'],
+            )
 
+perf_panel()
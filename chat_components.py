@@ -1,33 +1,37 @@
 import streamlit as st
-import pandas as pd
 from datetime import datetime
-import base64
-import json
-import pyperclip
-from io import BytesIO
-import requests
-from speech_to_text import recognize_speech
+import html
+import math
+from chat_store import get_chat_store, format_timestamp
+from chat_persistence import get_chat_database, load_persisted_conversation
+from asset_cache import read_emojis, avatar_css
+from perf import timed, perf_panel
 
-def get_image_base64(path):
-    with open(path, "rb") as img_file:
-        return base64.b64encode(img_file.read()).decode()
+# Number of messages shown per page of the conversation view
+DEFAULT_PAGE_SIZE = 50
 
 class ChatComponents:
-    def __init__(self, user, tag, chat_history_path):
+    def __init__(self, user, tag, chat_history_path, page_size=DEFAULT_PAGE_SIZE):
         self.user = user
         self.tag = tag
         self.chat_history_path = chat_history_path
+        self.page_size = page_size
+        self.database = get_chat_database(chat_history_path)
         self.initialize_session_state()
         self.load_chat_history()
 
     def load_chat_history(self):
-        if 'chat_histories' in st.session_state and not st.session_state['chat_histories'].empty:
-            df = st.session_state['chat_histories']
-            self.chatters = df[(df["MNDName"] == self.user) & (df["Tag"] == self.tag)]["Chatter"].unique().tolist()
-            self.has_chats = True
-        else:
-            self.chatters = []
-            self.has_chats = False
+        with timed('load_chat_history') as sample:
+            store = get_chat_store()
+            sample['rows'] = len(store)
+            if not store.empty:
+                self.chatters = store.chatters(self.user, self.tag)
+            else:
+                self.chatters = []
+            # Contacts saved on disk are listed before their conversations are loaded
+            persisted_chatters = self.database.chatters(self.user, self.tag)
+            self.chatters.extend([chatter for chatter in persisted_chatters if chatter not in self.chatters])
+            self.has_chats = not store.empty or bool(persisted_chatters)
         
         if st.session_state['new_contact']:
             self.chatters.extend([new_contact['name'] for new_contact in st.session_state['new_contact'] if new_contact['tag'] == self.tag and new_contact['name'] not in self.chatters])
@@ -64,11 +68,9 @@ class ChatComponents:
 
         if self.subtag == "":
             if self.has_chats:
-                df = st.session_state['chat_histories']
-                chatter_record = df[df["Chatter"] == self.chatter_name]
-                chatter_uniques = chatter_record["SubTag"].unique().tolist()
-                if chatter_uniques:
-                    self.subtag = chatter_uniques[0] if chatter_uniques else ""
+                chatter_subtag = get_chat_store().subtag(self.chatter_name)
+                if chatter_subtag is not None:
+                    self.subtag = chatter_subtag
             else:
                 self.subtag = "unknown"
 
@@ -77,10 +79,17 @@ class ChatComponents:
 
         self.handle_new_contact()
 
-        self.chatter_name = st.sidebar.selectbox("Select chatter:", self.chatters)
+        chatter_key = f"chatter_select_{self.user}_{self.tag}"
+        # The key is only set by a search jump, a stale value (e.g. None before the first
+        # contact was added) is dropped so the selectbox falls back to the first chatter
+        if st.session_state.get(chatter_key) not in self.chatters:
+            st.session_state.pop(chatter_key, None)
+        self.chatter_name = st.sidebar.selectbox("Select chatter:", self.chatters, key=chatter_key)
         if not self.chatter_name:
             st.sidebar.error("Please add a contact to start chatting!")
         else:
+            # Load the saved conversation the first time it is opened
+            load_persisted_conversation(get_chat_store(), self.database, self.user, self.chatter_name)
             # Assign the subtag value
             self.subtag_value()
             # Chat input fields
@@ -92,14 +101,11 @@ class ChatComponents:
             self.voice_input()
             # Send message button
             self.send_message()
+            # Message search
+            self.search_messages()
 
-    def read_emojis(self):
-        with open('emojis.json', 'r', encoding='utf-8') as f:
-            emojis = json.load(f)
-        return emojis
-    
     def send_emojis(self):
-        emoji_json = self.read_emojis()
+        emoji_json = read_emojis()
         emoji_keys = list(emoji_json.keys())
         emoji_keys.insert(0, "None")
         emoji_selecter = st.sidebar.selectbox("Choose an emoji:", emoji_keys, index=0)
@@ -117,25 +123,29 @@ class ChatComponents:
     def voice_input(self):
         voice_input = st.sidebar.checkbox("Enable Voice Input")
         if voice_input:
+            # Speech recognition and URL fetching are only imported once voice input is used
+            from speech_to_text import transcription_status
+            from audio_fetch import fetch_audio_url
             audio_upload_type = st.sidebar.radio("Upload audio file from:", ("Local", "URL"))
             if audio_upload_type == "Local":
                 audio_file = st.sidebar.file_uploader("Upload an audio file", type=['wav', 'mp3'])
             else:
                 audio_url = st.sidebar.text_input("Enter audio URL:")
                 if audio_url:
-                    response = requests.get(audio_url)
-                    audio_file = response.content
+                    # Downloaded with timeouts and a size cap, and cached by URL
+                    audio_file = fetch_audio_url(audio_url)
                 else:
                     audio_file = None
 
             if audio_file is not None:
                 st.sidebar.audio(audio_file)
-                # Convert the uploaded file to BytesIO
-                audio_data = BytesIO(audio_file.getvalue())
-                # Process the audio file
-                recognized_text = recognize_speech(audio_data)
+                # Transcribe the audio file in the background
+                recognized_text = transcription_status(audio_file.getvalue())
+                if recognized_text is None:
+                    return
                 # Button to copy text to clipboard
                 # if st.sidebar.button("Copy recognized text to Clipboard"):
+                #     import pyperclip
                 #     pyperclip.copy(recognized_text)
                 #     st.sidebar.success("Copied to clipboard!")
                 st.sidebar.markdown(f"""
@@ -146,29 +156,78 @@ class ChatComponents:
                 </div>
                 """, unsafe_allow_html=True)
     
+    def jump_to_message(self, chatter, position):
+        # Runs as a button callback, before the chatter selectbox is created again
+        st.session_state[f"chatter_select_{self.user}_{self.tag}"] = chatter
+        st.session_state['search_jump'] = {'mnd': self.user, 'chatter': chatter, 'position': position}
+
+    def search_messages(self):
+        query = st.sidebar.text_input("Search messages:", key=f"search_query_{self.user}_{self.tag}")
+        if not query:
+            return
+        scope = st.sidebar.radio("Search in:", ("This chat", f"All {self.tag} chats"), horizontal=True)
+        chatter = self.chatter_name if scope == "This chat" else None
+        if chatter is None:
+            # Conversations only saved on disk so far are loaded before all of them are searched
+            for persisted_chatter in self.database.chatters(self.user, self.tag):
+                load_persisted_conversation(get_chat_store(), self.database, self.user, persisted_chatter)
+        results = get_chat_store().search(query, self.user, chatter=chatter, tag=self.tag)
+        if results.empty:
+            st.sidebar.caption("No matching messages")
+            return
+        for position, row in zip(results.index, results.to_dict('records')):
+            label = f"{row['Chatter']} · {format_timestamp(row['Timestamp'])}: {str(row['Message'])[:60]}"
+            st.sidebar.button(label, key=f"search_result_{row['Chatter']}_{position}",
+                              on_click=self.jump_to_message, args=(row['Chatter'], position))
+
+    def message_html(self, row, position=None, highlighted=False):
+        is_user = row['Sender'] == self.user
+        return (
+            f"<div id=\"message-{position}\" style=\"display: flex; align-items: center; margin-bottom: 10px; width: 50%; {'margin-left: auto; justify-content: flex-end;' if is_user else 'justify-content: flex-start;'}\">"
+            f"<div class=\"chat-avatar {'chat-avatar-user' if is_user else 'chat-avatar-chatter'}\" style=\"{'order: 2; margin-left: 10px;' if is_user else ''} margin-right: 10px;\"></div>"
+            f"<div style=\"background-color: {'#009966' if is_user else '#3399CC'}; color: white; padding: 5px; border-radius: 10px; max-width: 100%; word-wrap: break-word; white-space: normal;{' outline: 3px solid #FFCC00;' if highlighted else ''}\">"
+            f"<div style='font-size: small; color: #CCCCCC;'>{html.escape(format_timestamp(row['Timestamp']))}</div>"
+            f"<div>{html.escape(str(row['Message']))}</div>"
+            f"</div>"
+            f"</div>"
+        )
+
     def display_chat_history(self):
-        user_chats = st.session_state['chat_histories']
-        relevant_chats = user_chats[(user_chats['MNDName'] == self.user) & (user_chats['Chatter'] == self.chatter_name)]
-        for _, row in relevant_chats.iterrows():
-            col1, col2 = st.columns([5, 5])
-            with col1 if row['Sender'] != self.user else col2:
-                man_img_base64 = get_image_base64('assets/man.png')
-                woman_img_base64 = get_image_base64('assets/woman.png')
-                st.markdown(f"""
-                <div style="display: flex; align-items: center; margin-bottom: 10px; {('justify-content: flex-start;' if row['Sender'] != self.user else 'justify-content: flex-end;')}">
-                    <div style="{('order: 2;' if row['Sender'] == self.user else '')} border-radius: 50%; width: 40px; height: 40px; overflow: hidden; margin-right: 10px; {('margin-left: 10px;' if row['Sender'] == self.user else '')}">
-                        <img src='data:image/png;base64,{man_img_base64 if row['Sender'] == self.user else woman_img_base64}' style="width: 100%; height: auto;">
-                    </div>
-                    <div style="background-color: {'#3399CC' if row['Sender'] != self.user else '#009966'}; color: white; padding: 5px; border-radius: 10px; max-width: 50%; word-wrap: break-word; white-space: normal;">
-                        <div style='font-size: small; color: #CCCCCC;'>{row['Timestamp']}</div>
-                        <div>{row['Message']}</div>
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
+        with timed('display_chat_history') as sample:
+            sample['rows'] = self.render_chat_history()
+
+    def render_chat_history(self):
+        store = get_chat_store()
+        total_messages = store.conversation_length(self.user, self.chatter_name)
+        # Only the newest messages are rendered, older pages are loaded on demand
+        window_key = f"history_window_{self.user}_{self.chatter_name}"
+        if window_key not in st.session_state:
+            st.session_state[window_key] = self.page_size
+        # Widen the window so a message picked from the search results is rendered, the
+        # jump is only applied once so later reruns show the usual window again
+        jump = st.session_state.pop('search_jump', None)
+        if jump and (jump['mnd'], jump['chatter']) == (self.user, self.chatter_name):
+            offset = store.conversation_offset(self.user, self.chatter_name, jump['position'])
+            st.session_state[window_key] = max(st.session_state[window_key], math.ceil(offset / self.page_size) * self.page_size)
+        else:
+            jump = None
+        if total_messages > st.session_state[window_key]:
+            hidden_messages = total_messages - st.session_state[window_key]
+            if st.button(f"Load older messages ({hidden_messages} more)", key=f"load_older_{window_key}"):
+                st.session_state[window_key] += self.page_size
+                st.rerun()
+        relevant_chats = store.conversation(self.user, self.chatter_name, last=st.session_state[window_key])
+        if relevant_chats.empty:
+            return 0
+        # Render the whole page of messages as a single HTML fragment
+        fragment = avatar_css() + "".join(self.message_html(row, position, jump is not None and position == jump['position'])
+                                          for position, row in zip(relevant_chats.index, relevant_chats.to_dict('records')))
+        st.markdown(fragment, unsafe_allow_html=True)
+        return len(relevant_chats)
 
     def process_sending_message(self):
         if self.send_message_button and self.chatter_message:
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            timestamp = datetime.now()
             new_chat = {
                 'MNDName': self.user,
                 'Chatter': self.chatter_name,
@@ -178,13 +237,14 @@ class ChatComponents:
                 'Message': self.chatter_message,
                 'Sender': self.selected_chatter
             }
-            current_record = st.session_state['chat_histories'].to_dict('records')
-            current_record.append(new_chat)
-            st.session_state['chat_histories'] = pd.DataFrame(current_record)
+            with timed('store_message'):
+                get_chat_store().append(new_chat)
+                self.database.append(new_chat)
             st.rerun()  
 
     def run(self):
         self.render_chat_interface()
         self.display_chat_history()
         if self.chatter_name:
-            self.process_sending_message()
\ No newline at end of file
+            self.process_sending_message()
+        perf_panel()
\ No newline at end of file
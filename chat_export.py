@@ -0,0 +1,32 @@
+import importlib.util
+import io
+from chat_store import TIMESTAMP_FORMAT
+
+# Rows serialized per batch when writing CSV
+CSV_CHUNK_ROWS = 100_000
+CATEGORY_COLUMNS = ['MNDName', 'Chatter', 'Tag', 'SubTag', 'Sender']
+
+EXPORT_FORMATS = {
+    "CSV": {'extension': ".csv", 'mime': "text/csv"},
+    "CSV (gzip)": {'extension': ".csv.gz", 'mime': "application/gzip"},
+    "Parquet": {'extension': ".parquet", 'mime': "application/vnd.apache.parquet"},
+}
+
+def available_formats():
+    # Parquet needs the optional pyarrow package
+    if importlib.util.find_spec("pyarrow") is None:
+        return [name for name in EXPORT_FORMATS if name != "Parquet"]
+    return list(EXPORT_FORMATS)
+
+def export_file_name(upload_name, export_format):
+    stem = upload_name[:-len(".csv")] if upload_name.lower().endswith(".csv") else upload_name
+    return f"updated_{stem}{EXPORT_FORMATS[export_format]['extension']}"
+
+def export_bytes(df, export_format):
+    buffer = io.BytesIO()
+    if export_format == "Parquet":
+        df.astype({column: 'category' for column in CATEGORY_COLUMNS}).to_parquet(buffer, index=False)
+    else:
+        compression = 'gzip' if export_format == "CSV (gzip)" else None
+        df.to_csv(buffer, index=False, date_format=TIMESTAMP_FORMAT, chunksize=CSV_CHUNK_ROWS, compression=compression)
+    return buffer.getvalue()
@@ -0,0 +1,47 @@
+import pandas as pd
+from chat_store import ChatStore, COLUMNS, parse_timestamps
+
+# Rows parsed per chunk, bounds the memory the CSV parser needs at any time
+CHUNK_ROWS = 100_000
+# Repeating name and tag columns are parsed as categoricals, the message as plain text.
+# Empty cells are kept as empty strings instead of NaN
+DTYPES = {
+    'MNDName': 'category',
+    'Chatter': 'category',
+    'Tag': 'category',
+    'SubTag': 'category',
+    'Timestamp': str,
+    'Message': str,
+    'Sender': 'category',
+}
+
+class ChatImportError(Exception):
+    pass
+
+def read_header(file):
+    try:
+        columns = pd.read_csv(file, nrows=0).columns.tolist()
+    except pd.errors.EmptyDataError:
+        raise ChatImportError("The uploaded CSV file is empty!")
+    finally:
+        file.seek(0)
+    return columns
+
+def import_chat_history(file, user=None, chunk_rows=CHUNK_ROWS, progress=None):
+    # Validate the header before reading the body, then load the rows chunk by chunk
+    # straight into one ChatStore shard per MNDName, optionally keeping only one user's rows
+    if read_header(file) != COLUMNS:
+        raise ChatImportError("The uploaded CSV file does not have the correct columns!")
+    size = getattr(file, 'size', None)
+    shards = {}
+    for chunk in pd.read_csv(file, chunksize=chunk_rows, dtype=DTYPES, keep_default_na=False):
+        if user is not None:
+            chunk = chunk[chunk['MNDName'] == user]
+        chunk['Timestamp'] = parse_timestamps(chunk['Timestamp'])
+        for mnd, rows in chunk.groupby('MNDName', sort=False, observed=True):
+            if mnd not in shards:
+                shards[mnd] = ChatStore()
+            shards[mnd].extend(rows)
+        if progress is not None and size:
+            progress(min(file.tell() / size, 1.0))
+    return shards
@@ -0,0 +1,148 @@
+import streamlit as st
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import pandas as pd
+from chat_store import COLUMNS, format_timestamp
+
+DEFAULT_CHAT_HISTORY_PATH = "./chat_history.csv"
+# Messages written per transaction at most, and the longest a message waits for its commit
+BATCH_SIZE = 256
+FLUSH_INTERVAL = 0.2
+# A failing batch is retried this many times before it is dropped
+WRITE_ATTEMPTS = 3
+# Longest flush() waits for the writer, in seconds
+FLUSH_TIMEOUT = 10
+
+logger = logging.getLogger(__name__)
+
+def chat_database_path(chat_history_path):
+    # Keep the database next to the CSV history instead of overwriting it
+    return os.path.splitext(chat_history_path)[0] + ".sqlite3"
+
+class ChatDatabase:
+    # Durable SQLite store of sent messages. Writes are queued and committed in batches
+    # by a background thread, so one fsync covers every message sent within FLUSH_INTERVAL
+    def __init__(self, path, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=FULL")
+        self.db.execute(f"CREATE TABLE IF NOT EXISTS messages (id INTEGER PRIMARY KEY, {', '.join(f'{column} TEXT' for column in COLUMNS)})")
+        self.db.execute("CREATE INDEX IF NOT EXISTS messages_conversation ON messages (MNDName, Chatter, id)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS messages_contacts ON messages (MNDName, Tag, Chatter)")
+        self.db.commit()
+        self.lock = threading.Lock()
+        self.pending = queue.Queue()
+        # Messages queued but not yet written or dropped, flush() waits for it to reach 0
+        self.unwritten = 0
+        self.written = threading.Condition()
+        self.failed = 0
+        self.writer = threading.Thread(target=self.write_batches, name="chat-database-writer", daemon=True)
+        self.writer.start()
+        atexit.register(self.flush)
+
+    def append(self, record):
+        with self.written:
+            self.unwritten += 1
+        # Timestamps are written in the same text format as the exported CSV
+        self.pending.put(tuple(format_timestamp(record[column]) if column == 'Timestamp' else str(record[column]) for column in COLUMNS))
+
+    def write_batches(self):
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.pending.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            try:
+                self.write_batch(batch)
+            finally:
+                with self.written:
+                    self.unwritten -= len(batch)
+                    self.written.notify_all()
+
+    def write_batch(self, batch):
+        for attempt in range(1, WRITE_ATTEMPTS + 1):
+            try:
+                with self.lock:
+                    try:
+                        self.db.executemany(f"INSERT INTO messages ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", batch)
+                        self.db.commit()
+                    except Exception:
+                        self.db.rollback()
+                        raise
+                return
+            except Exception:
+                if attempt == WRITE_ATTEMPTS:
+                    # Keep the writer alive, the messages stay in the in-memory store
+                    self.failed += len(batch)
+                    logger.exception("Dropping %d chat messages that could not be written to %s", len(batch), self.path)
+                else:
+                    time.sleep(self.flush_interval * attempt)
+
+    def flush(self, timeout=FLUSH_TIMEOUT):
+        # Wait until every queued message is committed or dropped, returns False on timeout
+        with self.written:
+            return self.written.wait_for(lambda: self.unwritten == 0, timeout=timeout)
+
+    def query(self, sql, parameters):
+        with self.lock:
+            return self.db.execute(sql, parameters).fetchall()
+
+    def chatters(self, mnd, tag):
+        return [row[0] for row in self.query("SELECT Chatter FROM messages WHERE MNDName = ? AND Tag = ? GROUP BY Chatter ORDER BY MIN(id)", (mnd, tag))]
+
+    def contacts(self, mnd):
+        # Chatters of every saved conversation of this user
+        return [row[0] for row in self.query("SELECT Chatter FROM messages WHERE MNDName = ? GROUP BY Chatter ORDER BY MIN(id)", (mnd,))]
+
+    def tags(self, mnds):
+        # Tags of the saved conversations of these users, without loading them
+        if not mnds:
+            return []
+        return [row[0] for row in self.query(f"SELECT DISTINCT Tag FROM messages WHERE MNDName IN ({', '.join('?' * len(mnds))})", tuple(mnds))]
+
+    def load_conversation(self, mnd, chatter):
+        rows = self.query(f"SELECT {', '.join(COLUMNS)} FROM messages WHERE MNDName = ? AND Chatter = ? ORDER BY id", (mnd, chatter))
+        return pd.DataFrame(rows, columns=COLUMNS)
+
+@st.cache_resource(show_spinner=False)
+def _open_chat_database(path):
+    return ChatDatabase(path)
+
+def get_chat_database(chat_history_path=DEFAULT_CHAT_HISTORY_PATH):
+    # Cached by absolute path, so every page spelling the same file shares one writer
+    return _open_chat_database(os.path.abspath(chat_database_path(chat_history_path)))
+
+def load_persisted_conversation(store, database, mnd, chatter):
+    # Conversations are loaded from disk the first time they are opened in this process
+    shard = store.shard(mnd)
+    with shard.lock:
+        if (mnd, chatter) in shard.loaded_conversations:
+            return
+        database.flush()
+        persisted = database.load_conversation(mnd, chatter)
+        # Skip messages the shard already holds, e.g. from a re-uploaded export
+        existing = shard.conversation(mnd, chatter)
+        if not existing.empty and not persisted.empty:
+            seen = set(zip(existing['Timestamp'].map(format_timestamp), existing['Message'].astype(str), existing['Sender'].astype(str)))
+            persisted = persisted[[key not in seen for key in zip(persisted['Timestamp'], persisted['Message'], persisted['Sender'])]]
+        shard.extend(persisted)
+        shard.loaded_conversations.add((mnd, chatter))
+
+def load_persisted_history(store, database):
+    # Every saved conversation of the store's users, e.g. before the history is exported.
+    # Queued sends are written first so contacts only saved so far are listed too
+    database.flush()
+    for mnd in list(store.users):
+        for chatter in database.contacts(mnd):
+            load_persisted_conversation(store, database, mnd, chatter)
@@ -0,0 +1,400 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+import math
+import re
+import threading
+from datetime import datetime
+
+COLUMNS = ['MNDName', 'Chatter', 'Tag', 'SubTag', 'Timestamp', 'Message', 'Sender']
+# Repeating name and tag columns, stored as codes into one table of distinct values
+NAME_COLUMNS = ['MNDName', 'Chatter', 'Tag', 'SubTag', 'Sender']
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+TIMESTAMP_DTYPE = 'datetime64[us]'
+# Minimum number of rows the column buffers grow by at a time
+CHUNK_SIZE = 1024
+# Maximum number of results returned by a message search
+SEARCH_LIMIT = 20
+TOKEN_PATTERN = re.compile(r"\w+")
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+def format_timestamp(value):
+    # Timestamps are only turned into text when they are displayed or written out
+    if pd.isna(value):
+        return ""
+    if isinstance(value, (datetime, np.datetime64)):
+        return pd.Timestamp(value).strftime(TIMESTAMP_FORMAT)
+    return str(value)
+
+def parse_timestamps(values):
+    # Try the format the app writes first and only fall back to per-value parsing
+    # for other layouts such as `2023/12/12 22:57`
+    timestamps = pd.to_datetime(values, format=TIMESTAMP_FORMAT, errors='coerce')
+    unparsed = timestamps.isna() & values.ne("")
+    if unparsed.any():
+        timestamps[unparsed] = pd.to_datetime(values[unparsed], format='mixed', errors='coerce')
+    return timestamps
+
+def to_datetime64(value):
+    # A single timestamp as stored, unparseable text becomes NaT
+    try:
+        return pd.Timestamp(value).to_datetime64()
+    except ValueError:
+        return np.datetime64('NaT')
+
+class ChatStore:
+    # Columnar, append-only chat history buffer. Name and tag columns are int32 codes
+    # into a table of distinct values and timestamps a datetime64 array, both growing in
+    # chunks so appending a message is amortized O(1). Messages are kept as Arrow-backed
+    # strings, with the latest sends in a short list until a chunk of them is compacted.
+    # The DataFrame view is only materialized (and cached) when a page actually reads it.
+    def __init__(self, df=None):
+        self._size = 0
+        self._capacity = 0
+        self._columns = {column: np.empty(0, dtype=np.int32) for column in NAME_COLUMNS}
+        self._columns['Timestamp'] = np.empty(0, dtype=TIMESTAMP_DTYPE)
+        self._names = []
+        self._name_codes = {}
+        self._name_dtype = None
+        self._message_chunks = []
+        self._message_tail = []
+        self._frame = None
+        self._reset_index()
+        # Conversations already loaded from the on-disk database
+        self.loaded_conversations = set()
+        # Guards the store when it is shared between sessions
+        self.lock = threading.RLock()
+        if df is not None:
+            self.extend(df)
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def empty(self):
+        return self._size == 0
+
+    def _reset_index(self):
+        # (MNDName, Chatter) -> row positions of that conversation, in insertion order
+        self._conversations = {}
+        # (MNDName, Tag) -> chatters of that user and tag, in first-seen order
+        self._chatters = {}
+        # Chatter -> first SubTag recorded for that chatter
+        self._subtags = {}
+        # Search term -> positions of the messages containing it, filled lazily up to _indexed_terms
+        self._terms = {}
+        self._indexed_terms = 0
+
+    def _index_row(self, position, mnd, chatter, tag, subtag):
+        self._conversations.setdefault((mnd, chatter), []).append(position)
+        self._chatters.setdefault((mnd, tag), {}).setdefault(chatter, None)
+        self._subtags.setdefault(chatter, subtag)
+
+    def _index_rows(self, start, stop):
+        # Index a block of rows with one groupby pass over the codes instead of row by row
+        keys = pd.DataFrame({column: self._columns[column][start:stop] for column in ['MNDName', 'Chatter', 'Tag', 'SubTag']})
+        for (mnd, chatter), positions in keys.groupby(['MNDName', 'Chatter'], sort=False).indices.items():
+            self._conversations.setdefault((self._name(mnd), self._name(chatter)), []).extend((positions + start).tolist())
+        for (mnd, tag), chatters in keys.groupby(['MNDName', 'Tag'], sort=False)['Chatter']:
+            self._chatters.setdefault((self._name(mnd), self._name(tag)), {}).update(dict.fromkeys(self._name(code) for code in chatters.unique().tolist()))
+        first_subtags = keys.drop_duplicates('Chatter')
+        for chatter, subtag in zip(first_subtags['Chatter'].tolist(), first_subtags['SubTag'].tolist()):
+            self._subtags.setdefault(self._name(chatter), self._name(subtag))
+
+    def _intern(self, value):
+        # Code of a name or tag, missing values are -1
+        if pd.isna(value):
+            return -1
+        code = self._name_codes.get(value)
+        if code is None:
+            code = self._name_codes[value] = len(self._names)
+            self._names.append(value)
+            self._name_dtype = None
+        return code
+
+    def _intern_values(self, values):
+        codes, uniques = pd.factorize(values)
+        table = np.array([self._intern(value) for value in uniques] + [-1], dtype=np.int32)
+        return table[codes]
+
+    def _name(self, code):
+        return self._names[code] if code >= 0 else None
+
+    def _flush_message_tail(self):
+        if self._message_tail:
+            self._message_chunks.append(pd.array(self._message_tail, dtype='str'))
+            self._message_tail = []
+
+    def _messages(self, positions):
+        # Gather messages from the compacted Arrow strings and the not yet compacted sends
+        if len(self._message_chunks) > 1:
+            self._message_chunks = [pd.concat([pd.Series(chunk) for chunk in self._message_chunks], ignore_index=True).array]
+        compacted = self._message_chunks[0] if self._message_chunks else pd.array([], dtype='str')
+        in_compacted = positions < len(compacted)
+        if in_compacted.all():
+            return compacted.take(positions)
+        messages = np.empty(len(positions), dtype=object)
+        messages[in_compacted] = compacted.take(positions[in_compacted]).to_numpy()
+        messages[~in_compacted] = [self._message_tail[position - len(compacted)] for position in positions[~in_compacted]]
+        return pd.array(messages, dtype='str')
+
+    def _reserve(self, needed):
+        if needed <= self._capacity:
+            return
+        # Leave headroom so the following appends don't have to copy the columns again
+        capacity = needed + max(CHUNK_SIZE, needed // 2)
+        for column, values in self._columns.items():
+            grown = np.empty(capacity, dtype=values.dtype)
+            grown[:self._size] = values[:self._size]
+            self._columns[column] = grown
+        self._capacity = capacity
+
+    def append(self, record):
+        self._reserve(self._size + 1)
+        for column in NAME_COLUMNS:
+            self._columns[column][self._size] = self._intern(record[column])
+        # Sends are kept to the second like every saved form of the history, so a
+        # downloaded and re-uploaded file matches the rows already held
+        self._columns['Timestamp'][self._size] = to_datetime64(record['Timestamp']).astype('datetime64[s]')
+        self._message_tail.append(str(record['Message']))
+        if len(self._message_tail) >= CHUNK_SIZE:
+            self._flush_message_tail()
+        self._index_row(self._size, record['MNDName'], record['Chatter'], record['Tag'], record['SubTag'])
+        self._size += 1
+        self._frame = None
+
+    def extend(self, df):
+        count = len(df)
+        if count == 0:
+            return
+        self._reserve(self._size + count)
+        for column in NAME_COLUMNS:
+            self._columns[column][self._size:self._size + count] = self._intern_values(df[column])
+        timestamps = df['Timestamp']
+        if not pd.api.types.is_datetime64_any_dtype(timestamps):
+            # Rows read back from the database hold formatted text
+            timestamps = parse_timestamps(timestamps.astype(str))
+        self._columns['Timestamp'][self._size:self._size + count] = timestamps.to_numpy(dtype=TIMESTAMP_DTYPE)
+        self._flush_message_tail()
+        self._message_chunks.append(df['Message'].astype('str').array)
+        self._index_rows(self._size, self._size + count)
+        self._size += count
+        self._frame = None
+
+    @property
+    def frame(self):
+        # Flush the buffered rows into a DataFrame lazily, once per change
+        if self._frame is None:
+            self._frame = self._rows(np.arange(self._size))
+        return self._frame
+
+    def memory_usage(self):
+        # Bytes held by the column buffers
+        return (sum(values.nbytes for values in self._columns.values())
+                + sum(chunk.nbytes for chunk in self._message_chunks)
+                + sum(len(message) for message in self._message_tail))
+
+    def chatters(self, mnd, tag):
+        return list(self._chatters.get((mnd, tag), {}))
+
+    def subtag(self, chatter):
+        return self._subtags.get(chatter)
+
+    def conversation_length(self, mnd, chatter):
+        return len(self._conversations.get((mnd, chatter), []))
+
+    def conversation(self, mnd, chatter, last=None):
+        # Only gather the rows of this conversation rather than masking the whole frame
+        positions = self._conversations.get((mnd, chatter), [])
+        if last is not None:
+            positions = positions[max(len(positions) - last, 0):]
+        return self._rows(positions)
+
+    def conversation_offset(self, mnd, chatter, position):
+        # How many messages of the conversation, counted from the newest, reach back to this one
+        positions = self._conversations.get((mnd, chatter), [])
+        return len(positions) - positions.index(position) if position in positions else 0
+
+    def _index_terms(self):
+        # Only index the messages added since the previous search
+        messages = self._messages(np.arange(self._indexed_terms, self._size))
+        for position, message in enumerate(messages.tolist(), self._indexed_terms):
+            for term in set(tokenize(message)):
+                self._terms.setdefault(term, []).append(position)
+        self._indexed_terms = self._size
+
+    def search(self, query, mnd=None, chatter=None, tag=None, limit=SEARCH_LIMIT):
+        # Rank messages by the summed inverse document frequency of the query terms they
+        # contain, newer messages first on ties
+        self._index_terms()
+        postings = [(np.asarray(self._terms[term]), math.log(1 + self._size / len(self._terms[term])))
+                    for term in set(tokenize(query)) if term in self._terms]
+        if not postings:
+            return self._rows([]).assign(Score=[])
+        positions, inverse = np.unique(np.concatenate([positions for positions, _ in postings]), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate([np.full(len(positions), idf) for positions, idf in postings]))
+        in_scope = np.ones(len(positions), dtype=bool)
+        for column, value in (('MNDName', mnd), ('Chatter', chatter), ('Tag', tag)):
+            if value is not None:
+                in_scope &= self._columns[column][positions] == self._name_codes.get(value, -2)
+        positions, scores = positions[in_scope], scores[in_scope]
+        best = np.lexsort((-positions, -scores))[:limit]
+        return self._rows(positions[best]).assign(Score=scores[best])
+
+    def tags(self):
+        return list(dict.fromkeys(tag for _, tag in self._chatters))
+
+    def extend_missing(self, df):
+        # Add only the rows this store does not hold yet, e.g. when the same history is uploaded again
+        if not self.empty and len(df):
+            keys = ['Chatter', 'Timestamp', 'Message', 'Sender']
+            # Gathered without filling the frame cache, so the shared shard keeps no full copy
+            existing = pd.MultiIndex.from_frame(self._rows(np.arange(self._size))[keys].astype({'Chatter': str, 'Message': str, 'Sender': str}))
+            incoming = pd.MultiIndex.from_frame(df[keys].astype({'Chatter': str, 'Message': str, 'Sender': str}))
+            df = df[~incoming.isin(existing)]
+        self.extend(df)
+
+    def select(self, mnd=None, tag=None, start=None, end=None):
+        # Rows of one user and/or one tag, optionally only those sent from start until
+        # before end, in their original order
+        if mnd is None:
+            positions = np.arange(self._size)
+        else:
+            conversations = [positions for (conversation_mnd, _), positions in self._conversations.items() if conversation_mnd == mnd]
+            positions = np.sort(np.concatenate(conversations)) if conversations else np.empty(0, dtype=int)
+        if tag is not None:
+            positions = positions[self._columns['Tag'][positions] == self._name_codes.get(tag, -2)]
+        if start is not None:
+            positions = positions[self._columns['Timestamp'][positions] >= to_datetime64(start)]
+        if end is not None:
+            positions = positions[self._columns['Timestamp'][positions] < to_datetime64(end)]
+        return self._rows(positions)
+
+    def _rows(self, positions):
+        # Rows keep their position in the store as index. Names come out as categoricals
+        # sharing one dtype, so they are not converted back to Python strings
+        positions = np.asarray(positions, dtype=np.intp)
+        if self._name_dtype is None:
+            self._name_dtype = pd.CategoricalDtype(self._names)
+        data = {column: pd.Categorical.from_codes(self._columns[column][positions], dtype=self._name_dtype) for column in NAME_COLUMNS}
+        data['Timestamp'] = self._columns['Timestamp'][positions]
+        data['Message'] = self._messages(positions)
+        return pd.DataFrame(data, columns=COLUMNS, index=positions)
+
+class SharedChatStore:
+    # Process-wide chat history, sharded into one ChatStore per MNDName so sessions
+    # of different users never contend on the same lock
+    def __init__(self):
+        self.shards = {}
+        self.lock = threading.Lock()
+
+    def shard(self, mnd):
+        with self.lock:
+            if mnd not in self.shards:
+                self.shards[mnd] = ChatStore()
+            return self.shards[mnd]
+
+    def merge(self, shards):
+        # Add freshly imported shards to the shared ones. Rows other sessions already hold,
+        # including their sends, are kept, and rows already present are not added twice
+        for mnd, imported in shards.items():
+            with self.lock:
+                shard = self.shards.setdefault(mnd, imported)
+            if shard is not imported:
+                with shard.lock:
+                    shard.extend_missing(imported.frame)
+
+class ChatCursor:
+    # A session's view of the shared store: just the MNDNames it can read. Every read
+    # copies the rows out under the shard's lock, so callers get a consistent snapshot
+    def __init__(self, shared, users=()):
+        self.shared = shared
+        self.users = list(dict.fromkeys(users))
+
+    def add_user(self, mnd):
+        if mnd not in self.users:
+            self.users.append(mnd)
+
+    def shard(self, mnd):
+        self.add_user(mnd)
+        return self.shared.shard(mnd)
+
+    def shards(self):
+        return [self.shared.shard(mnd) for mnd in self.users]
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards())
+
+    @property
+    def empty(self):
+        return len(self) == 0
+
+    def append(self, record):
+        shard = self.shard(record['MNDName'])
+        with shard.lock:
+            shard.append(record)
+
+    def chatters(self, mnd, tag):
+        shard = self.shard(mnd)
+        with shard.lock:
+            return shard.chatters(mnd, tag)
+
+    def subtag(self, chatter):
+        for shard in self.shards():
+            with shard.lock:
+                subtag = shard.subtag(chatter)
+            if subtag is not None:
+                return subtag
+        return None
+
+    def conversation_length(self, mnd, chatter):
+        shard = self.shard(mnd)
+        with shard.lock:
+            return shard.conversation_length(mnd, chatter)
+
+    def conversation(self, mnd, chatter, last=None):
+        shard = self.shard(mnd)
+        with shard.lock:
+            return shard.conversation(mnd, chatter, last=last)
+
+    def conversation_offset(self, mnd, chatter, position):
+        shard = self.shard(mnd)
+        with shard.lock:
+            return shard.conversation_offset(mnd, chatter, position)
+
+    def search(self, query, mnd, chatter=None, tag=None):
+        shard = self.shard(mnd)
+        with shard.lock:
+            return shard.search(query, mnd=mnd, chatter=chatter, tag=tag)
+
+    def tags(self):
+        tags = {}
+        for shard in self.shards():
+            with shard.lock:
+                tags.update(dict.fromkeys(shard.tags()))
+        return list(tags)
+
+    def select(self, mnd=None, tag=None, start=None, end=None):
+        frames = []
+        for shard in ([self.shard(mnd)] if mnd is not None else self.shards()):
+            with shard.lock:
+                frames.append(shard.select(tag=tag, start=start, end=end))
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=COLUMNS)
+
+    @property
+    def frame(self):
+        return self.select()
+
+@st.cache_resource(show_spinner=False)
+def get_shared_chat_store():
+    return SharedChatStore()
+
+def get_chat_store():
+    if 'chat_histories' not in st.session_state:
+        st.session_state['chat_histories'] = ChatCursor(get_shared_chat_store())
+    store = st.session_state['chat_histories']
+    if st.session_state.get('current_user'):
+        store.add_user(st.session_state['current_user'])
+    return store
@@ -0,0 +1,10 @@
+# Relationship tags that have a chat page, tag -> label shown in the sidebar
+CHAT_TAGS = {
+    "family": "Families",
+    "friend": "Friends",
+    "colleague": "Colleagues",
+    "neighbor": "Neighbors",
+    "schoolmate": "Schoolmates",
+    "other": "Others",
+}
+DEFAULT_TAG = "family"
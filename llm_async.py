@@ -0,0 +1,105 @@
+import asyncio
+import queue
+import threading
+import time
+from llm_stream import iter_stream_tokens, strip_quotes
+
+# Overall time allowed for one attempt at a completion, in seconds
+REQUEST_TIMEOUT = 60
+MAX_RETRIES = 2
+# Delay before the first retry, doubled for every further retry
+RETRY_BACKOFF = 0.5
+# Maximum number of requests in flight to the LLM backend across all sessions
+MAX_CONCURRENCY = 8
+
+class TokenStream:
+    # Tokens of a streamed completion, produced on a worker thread and read by the script.
+    # Iteration ends early when the request failed, the reason is left in error
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.tokens = queue.Queue()
+        self.error = None
+        self.attempts = 0
+
+    def put(self, token):
+        self.tokens.put((token, False))
+
+    def finish(self, error, attempts):
+        self.error = error
+        self.attempts = attempts
+        self.tokens.put((None, True))
+
+    def __iter__(self):
+        while True:
+            try:
+                token, done = self.tokens.get(timeout=self.timeout)
+            except queue.Empty:
+                self.error = "request timed out"
+                return
+            if done:
+                return
+            yield token
+
+class AsyncLLMRunner:
+    # Runs LLM requests on one background event loop shared by every session, so
+    # timeouts, retries and the concurrency limit apply process-wide
+    def __init__(self, max_concurrency=MAX_CONCURRENCY):
+        self.loop = asyncio.new_event_loop()
+        # Taken by the worker thread itself, so a request that timed out keeps its slot
+        # until the blocking call really returns and retries cannot exceed the limit
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.thread = threading.Thread(target=self.loop.run_forever, name="llm-async-runner", daemon=True)
+        self.thread.start()
+
+    def run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def call(self, function, *args):
+        with self.slots:
+            return function(*args)
+
+    async def complete(self, llama, api_request_json, timeout=REQUEST_TIMEOUT, retries=MAX_RETRIES, backoff=RETRY_BACKOFF):
+        model = api_request_json["model"]
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                # The clients are blocking, so each request runs in the loop's worker threads
+                response = await asyncio.wait_for(asyncio.to_thread(self.call, llama.run, {**api_request_json, "stream": False}), timeout)
+                answer = strip_quotes(response.json()["choices"][0]["message"]["content"])
+                return {"model": model, "answer": answer, "error": None, "attempts": attempt, "latency": time.perf_counter() - start}
+            except Exception as e:
+                if attempt > retries:
+                    error = "request timed out" if isinstance(e, asyncio.TimeoutError) else str(e) or type(e).__name__
+                    return {"model": model, "answer": None, "error": error, "attempts": attempt, "latency": time.perf_counter() - start}
+                await asyncio.sleep(backoff * 2 ** (attempt - 1))
+
+    async def compare(self, llama, api_requests, **kwargs):
+        # Send one request per model in parallel, each sized for its model's context window
+        return await asyncio.gather(*(self.complete(llama, api_request_json, **kwargs) for api_request_json in api_requests))
+
+    def stream(self, llama, api_request_json, timeout=REQUEST_TIMEOUT, retries=MAX_RETRIES, backoff=RETRY_BACKOFF):
+        # Start streaming a completion in the background and return its TokenStream. Attempts
+        # that fail before the first token are retried, after that the error ends the stream
+        stream = TokenStream(timeout)
+        threading.Thread(target=self.produce, args=(llama, api_request_json, stream, retries, backoff), name="llm-stream", daemon=True).start()
+        return stream
+
+    def produce(self, llama, api_request_json, stream, retries, backoff):
+        attempt = 0
+        while True:
+            attempt += 1
+            started = False
+            try:
+                with self.slots:
+                    for token in iter_stream_tokens(llama, api_request_json):
+                        started = True
+                        stream.put(token)
+                stream.finish(None, attempt)
+                return
+            except Exception as e:
+                if started or attempt > retries:
+                    stream.finish(str(e) or type(e).__name__, attempt)
+                    return
+                time.sleep(backoff * 2 ** (attempt - 1))
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from llm_stream import FakeResponse, format_stream_chunk, parse_stream_chunks, iter_chunks
+
+# Total size of the cached completions kept in memory, in bytes
+MAX_MEMORY_BYTES = 16 * 1024 * 1024
+# Cached completions older than this are ignored, in seconds
+DEFAULT_TTL = 24 * 60 * 60
+
+def completion_key(api_request_json, conversation=None):
+    if conversation is None:
+        payload = {"model": api_request_json["model"], "messages": api_request_json["messages"]}
+    else:
+        # Replay mode: only the system prompt and the latest user message count, so a
+        # replayed script hits the cache whatever history came before it in this conversation
+        messages = api_request_json["messages"]
+        payload = {
+            "model": api_request_json["model"],
+            "conversation": list(conversation),
+            "system": [message["content"] for message in messages if message["role"] == "system"],
+            "user": next((message["content"] for message in reversed(messages) if message["role"] == "user"), None),
+        }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+class CompletionCache:
+    # In-memory LRU of completions with an optional SQLite tier on disk
+    def __init__(self, max_bytes=MAX_MEMORY_BYTES, ttl=DEFAULT_TTL, db_path=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.db = None
+        if db_path:
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute("CREATE TABLE IF NOT EXISTS completions (key TEXT PRIMARY KEY, content TEXT, created REAL)")
+            self.db.commit()
+
+    def expired(self, created, now):
+        return self.ttl is not None and now - created > self.ttl
+
+    def remember(self, key, content, created):
+        if key in self.entries:
+            self.size -= len(self.entries.pop(key)[0].encode('utf-8'))
+        self.entries[key] = (content, created)
+        self.size += len(content.encode('utf-8'))
+        # Evict the least recently used completions until the memory budget fits
+        while self.size > self.max_bytes and self.entries:
+            _, (evicted, _) = self.entries.popitem(last=False)
+            self.size -= len(evicted.encode('utf-8'))
+
+    def get(self, key):
+        with self.lock:
+            now = time.time()
+            if key in self.entries:
+                content, created = self.entries[key]
+                if not self.expired(created, now):
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return content
+                self.size -= len(self.entries.pop(key)[0].encode('utf-8'))
+            if self.db is not None:
+                row = self.db.execute("SELECT content, created FROM completions WHERE key = ?", (key,)).fetchone()
+                if row is not None and not self.expired(row[1], now):
+                    self.remember(key, row[0], row[1])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, key, content):
+        with self.lock:
+            created = time.time()
+            self.remember(key, content, created)
+            if self.db is not None:
+                self.db.execute("INSERT OR REPLACE INTO completions (key, content, created) VALUES (?, ?, ?)", (key, content, created))
+                self.db.commit()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {'entries': len(self.entries), 'bytes': self.size, 'hits': self.hits, 'disk_hits': self.disk_hits,
+                    'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0}
+
+class CachedLlamaClient:
+    # Wraps a client with the same run() interface and answers repeated prompts from the cache.
+    # Passing the (mnd, chatter) conversation turns on replay mode, see completion_key
+    def __init__(self, llama, cache, conversation=None):
+        self.llama = llama
+        self.cache = cache
+        self.conversation = conversation
+
+    def run_sync(self, api_request_json, key, content):
+        if content is not None:
+            return FakeResponse({"model": api_request_json["model"], "choices": [{"index": 0, "message": {"role": "assistant", "content": content}}]})
+        response = self.llama.run(api_request_json)
+        self.cache.put(key, response.json()["choices"][0]["message"]["content"])
+        return response
+
+    def run_stream(self, api_request_json, key, content):
+        if content is not None:
+            yield format_stream_chunk(api_request_json["model"], content)
+            return
+        tokens = []
+        for token in parse_stream_chunks(iter_chunks(self.llama.run(api_request_json))):
+            tokens.append(token)
+            yield format_stream_chunk(api_request_json["model"], token)
+        # Only completions that streamed to the end are cached
+        self.cache.put(key, "".join(tokens))
+
+    def run(self, api_request_json):
+        key = completion_key(api_request_json, self.conversation)
+        content = self.cache.get(key)
+        if api_request_json.get('stream', False):
+            return self.run_stream(api_request_json, key, content)
+        else:
+            return self.run_sync(api_request_json, key, content)
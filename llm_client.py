@@ -0,0 +1,100 @@
+import codecs
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_HOSTNAME = 'https://api.llama-api.com'
+DEFAULT_DOMAIN_PATH = '/chat/completions'
+# Clients unused for longer than this are closed and dropped from the pool
+IDLE_TIMEOUT = 15 * 60
+POOL_CONNECTIONS = 10
+# Connect and read timeouts of every request, in seconds
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 60
+
+class LlamaClient:
+    # Drop-in replacement for LlamaAPI.run that keeps its HTTP connections alive
+    # in a requests.Session, so consecutive messages reuse the same TLS connection
+    def __init__(self, api_token, hostname=DEFAULT_HOSTNAME, domain_path=DEFAULT_DOMAIN_PATH, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)):
+        self.api_token = api_token
+        self.timeout = timeout
+        self.url = f"{hostname}{domain_path}"
+        self.http = requests.Session()
+        self.http.headers.update({'Authorization': f'Bearer {api_token}'})
+        self.adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_CONNECTIONS)
+        self.http.mount('https://', self.adapter)
+        self.http.mount('http://', self.adapter)
+
+    def run_sync(self, api_request_json):
+        response = self.http.post(self.url, json=api_request_json, timeout=self.timeout)
+        if response.status_code != 200:
+            raise Exception(f"POST {response.status_code} {response.json()['detail']}")
+        return response
+
+    def run_stream(self, api_request_json):
+        with self.http.post(self.url, json=api_request_json, stream=True, timeout=self.timeout) as response:
+            if response.status_code != 200:
+                raise Exception(f"POST {response.status_code} {response.json()['detail']}")
+            # A multi-byte character, e.g. an emoji, can be split between two network chunks
+            decoder = codecs.getincrementaldecoder('utf-8')()
+            for chunk in response.iter_content(chunk_size=None):
+                text = decoder.decode(chunk)
+                if text:
+                    yield text
+            text = decoder.decode(b"", final=True)
+            if text:
+                yield text
+
+    def run(self, api_request_json):
+        if api_request_json.get('stream', False):
+            return self.run_stream(api_request_json)
+        else:
+            return self.run_sync(api_request_json)
+
+    def connection_count(self):
+        # Number of TCP/TLS connections opened by this client so far
+        pools = self.adapter.poolmanager.pools
+        return sum(pools[key].num_connections for key in pools.keys())
+
+    def close(self):
+        self.http.close()
+
+class LlamaClientPool:
+    # Process-wide pool of clients keyed by API key, shared by every session
+    def __init__(self, client_factory=LlamaClient, idle_timeout=IDLE_TIMEOUT):
+        self.client_factory = client_factory
+        self.idle_timeout = idle_timeout
+        self.clients = {}
+        self.last_used = {}
+        self.hits = 0
+        self.created = 0
+        self.evicted = 0
+        self.lock = threading.Lock()
+
+    def evict_idle(self, now=None):
+        now = time.monotonic() if now is None else now
+        for api_key in [key for key, used in self.last_used.items() if now - used > self.idle_timeout]:
+            client = self.clients.pop(api_key)
+            del self.last_used[api_key]
+            if hasattr(client, 'close'):
+                client.close()
+            self.evicted += 1
+
+    def get(self, api_key):
+        with self.lock:
+            now = time.monotonic()
+            self.evict_idle(now)
+            if api_key in self.clients:
+                self.hits += 1
+            else:
+                self.clients[api_key] = self.client_factory(api_key)
+                self.created += 1
+            self.last_used[api_key] = now
+            return self.clients[api_key]
+
+    def stats(self):
+        with self.lock:
+            connections = sum(client.connection_count() for client in self.clients.values() if hasattr(client, 'connection_count'))
+            return {'clients': len(self.clients), 'hits': self.hits, 'created': self.created,
+                    'evicted': self.evicted, 'connections': connections}
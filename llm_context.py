@@ -0,0 +1,85 @@
+# Context window of every selectable model, in tokens
+MODEL_CONTEXT_LIMITS = {
+    "llama-7b-chat": 4096, "llama-7b-32k": 32768, "llama-13b-chat": 4096, "llama-70b-chat": 4096,
+    "mixtral-8x7b-instruct": 32768, "mistral-7b-instruct": 8192, "mistral-7b": 8192,
+    "Nous-Hermes-Llama2-13b": 4096, "falcon-7b-instruct": 2048, "falcon-40b-instruct": 2048,
+    "alpaca-7b": 2048, "codellama-7b-instruct": 16384, "codellama-13b-instruct": 16384,
+    "codellama-34b-instruct": 16384, "openassistant-llama2-70b": 4096,
+    "vicuna-7b": 4096, "vicuna-13b": 4096, "vicuna-13b-16k": 16384,
+}
+DEFAULT_CONTEXT_LIMIT = 4096
+# Tokens kept free for the model's reply
+RESPONSE_TOKENS = 512
+# Share of the context that persona and example inputs may take
+PERSONA_SHARE = 0.25
+# Extra tokens the chat template adds around every message
+MESSAGE_OVERHEAD = 4
+
+def count_tokens(text):
+    # Cheap estimate of ~4 characters per token, close enough for budgeting without a tokenizer
+    return (len(text) + 3) // 4
+
+def message_tokens(message):
+    return count_tokens(message["content"]) + MESSAGE_OVERHEAD
+
+def context_budget(model):
+    return MODEL_CONTEXT_LIMITS.get(model, DEFAULT_CONTEXT_LIMIT) - RESPONSE_TOKENS
+
+def persona_budget(model):
+    return int(context_budget(model) * PERSONA_SHARE)
+
+def truncate_to_tokens(text, budget):
+    if text is None or count_tokens(text) <= budget:
+        return text
+    return text[:budget * 4]
+
+def take_examples(examples, budget):
+    # Keep whole examples from the start of the list until the budget runs out
+    if examples is None:
+        return None
+    taken = []
+    for example in examples:
+        budget -= count_tokens(str(example))
+        if budget < 0:
+            break
+        taken.append(example)
+    return taken
+
+class ContextBuilder:
+    # Keeps the turns of one (mnd, chatter) conversation as chat messages together with
+    # their token counts, so each request only converts the rows added since the last one
+    def __init__(self, mnd, chatter):
+        self.mnd = mnd
+        self.chatter = chatter
+        self.shard = None
+        self.turns = []
+        self.loaded = 0
+
+    def sync(self, store):
+        # Start over when the user's shard was replaced by a new upload
+        shard = store.shard(self.mnd)
+        length = store.conversation_length(self.mnd, self.chatter)
+        if shard is not self.shard or length < self.loaded:
+            self.shard = shard
+            self.turns = []
+            self.loaded = 0
+        if length > self.loaded:
+            for row in store.conversation(self.mnd, self.chatter, last=length - self.loaded).to_dict('records'):
+                # The model speaks for the MND patient, the user types as the chatter
+                message = {"role": "assistant" if row['Sender'] == self.mnd else "user", "content": str(row['Message'])}
+                self.turns.append((message, message_tokens(message)))
+            self.loaded = length
+
+    def build(self, model, system_prompt, user_input):
+        system_message = {"role": "system", "content": system_prompt}
+        user_message = {"role": "user", "content": user_input}
+        remaining = context_budget(model) - message_tokens(system_message) - message_tokens(user_message)
+        history = []
+        # Fill the rest of the budget with the most recent turns
+        for message, tokens in reversed(self.turns):
+            remaining -= tokens
+            if remaining < 0:
+                break
+            history.append(message)
+        history.reverse()
+        return [system_message] + history + [user_message]
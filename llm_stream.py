@@ -0,0 +1,125 @@
+import asyncio
+import json
+import time
+
+STREAM_DONE = "[DONE]"
+
+def parse_stream_line(line):
+    # Server-sent event lines look like `data: {...chat completion chunk...}`
+    line = line.strip()
+    if line.startswith("data:"):
+        line = line[len("data:"):].strip()
+    if not line or line == STREAM_DONE:
+        return None
+    try:
+        chunk = json.loads(line)
+    except json.JSONDecodeError:
+        return None
+    choices = chunk.get("choices") or [{}]
+    delta = choices[0].get("delta") or choices[0].get("message") or {}
+    return delta.get("content")
+
+def iter_chunks(chunks):
+    # LlamaAPI.run returns an async generator of raw chunks in streaming mode, drive it
+    # from a private event loop so the Streamlit script can consume it synchronously
+    if not hasattr(chunks, '__anext__'):
+        yield from chunks
+        return
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(chunks.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(chunks.aclose())
+        loop.close()
+
+def format_stream_chunk(model, content):
+    chunk = {"model": model, "choices": [{"index": 0, "delta": {"content": content}}]}
+    return f"data: {json.dumps(chunk)}\n"
+
+def parse_stream_chunks(chunks):
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        lines = buffer.split("\n")
+        buffer = lines.pop()
+        for line in lines:
+            token = parse_stream_line(line)
+            if token:
+                yield token
+    token = parse_stream_line(buffer)
+    if token:
+        yield token
+
+def iter_stream_tokens(llama, api_request_json):
+    yield from parse_stream_chunks(iter_chunks(llama.run({**api_request_json, "stream": True})))
+
+class QuoteStripper:
+    # Drops the opening quote of a reply and holds back a trailing quote until
+    # more text arrives, so quoted replies can be stripped while streaming
+    def __init__(self):
+        self.started = False
+        self.pending = ""
+
+    def feed(self, token):
+        text = self.pending + token
+        self.pending = ""
+        if not self.started and text:
+            self.started = True
+            if text.startswith('"'):
+                text = text[1:]
+        if text.endswith('"'):
+            self.pending = '"'
+            text = text[:-1]
+        return text
+
+def strip_quotes(text):
+    return QuoteStripper().feed(text)
+
+def strip_quotes_stream(tokens):
+    stripper = QuoteStripper()
+    for token in tokens:
+        text = stripper.feed(token)
+        if text:
+            yield text
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.payload = payload
+        self.status_code = 200
+
+    def json(self):
+        return self.payload
+
+class FakeLlamaAPI:
+    # Local stand-in for LlamaAPI that answers with a canned reply, used to run
+    # and benchmark the chat page offline
+    def __init__(self, api_token=None, reply='"Thanks for the message, talk soon!"', token_delay=0.02, first_token_delay=0.2):
+        self.api_token = api_token
+        self.reply = reply
+        self.token_delay = token_delay
+        self.first_token_delay = first_token_delay
+
+    def tokens(self):
+        words = self.reply.split(" ")
+        return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+    async def run_stream(self, api_request_json):
+        await asyncio.sleep(self.first_token_delay)
+        for token in self.tokens():
+            yield format_stream_chunk(api_request_json["model"], token)
+            await asyncio.sleep(self.token_delay)
+        yield f"data: {STREAM_DONE}\n"
+
+    def run_sync(self, api_request_json):
+        time.sleep(self.first_token_delay + self.token_delay * len(self.tokens()))
+        return FakeResponse({"model": api_request_json["model"], "choices": [{"index": 0, "message": {"role": "assistant", "content": self.reply}}]})
+
+    def run(self, api_request_json):
+        if api_request_json.get('stream', False):
+            return self.run_stream(api_request_json)
+        else:
+            return self.run_sync(api_request_json)
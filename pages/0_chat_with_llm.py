@@ -1,13 +1,13 @@
 import streamlit as st
-import pandas as pd
 from datetime import datetime
-import pyperclip
-from io import BytesIO
-import requests
-import json
-import asyncio
-from speech_to_text import recognize_speech
-from llamaapi import LlamaAPI
+import os
+from chat_store import get_chat_store
+from chat_persistence import get_chat_database, load_persisted_conversation
+from asset_cache import read_emojis
+from llm_stream import strip_quotes_stream
+from llm_context import MODEL_CONTEXT_LIMITS, ContextBuilder, persona_budget
+from persona import content_hash, parse_bundle, render_prompt
+from perf import timed, instrument, perf_panel
 
 def experimental_file_uploader():
     mnd_persona_file = st.sidebar.file_uploader("Upload MND Persona JSON", type="json")
@@ -18,31 +18,26 @@ def experimental_file_uploader():
     if mnd_persona_file is None or chatter_persona_file is None or example_mnd_msgs_file is None or example_chat_msgs_file is None:
         st.sidebar.warning("Please upload all the required files!")
     
-    mnd_persona, chatter_persona, example_mnd_msgs, example_chat_msgs = None, None, None, None
-    
-    if mnd_persona_file:
-        mnd_persona = json.load(mnd_persona_file)
-        mnd_persona = json.dumps(mnd_persona)
-    
-    if chatter_persona_file:
-        chatter_persona = json.load(chatter_persona_file)
-        chatter_persona = json.dumps(chatter_persona)
+    uploads = [None if file is None else file.getvalue() for file in (mnd_persona_file, chatter_persona_file, example_mnd_msgs_file, example_chat_msgs_file)]
+    key = tuple(content_hash(data) for data in uploads)
+    # Only parse the uploads again when one of them changed
+    if 'persona_bundle' not in st.session_state or st.session_state['persona_bundle'].key != key:
+        st.session_state['persona_bundle'] = parse_bundle(*uploads)
+    return st.session_state['persona_bundle']
 
-    # Processing the uploaded text files
-    if example_mnd_msgs_file:
-        example_mnd_msgs = example_mnd_msgs_file.getvalue().decode("utf-8").split("\n")
-    
-    if example_chat_msgs_file:
-        example_chat_msgs = example_chat_msgs_file.getvalue().decode("utf-8").split("\n")
-        example_chat_msgs = [{
-            "chatter": m.split(":")[0],
-            "content": m.split(":")[1].strip().replace('"', "")
-        } for m in example_chat_msgs if m.strip() != ""]
-    return mnd_persona, chatter_persona, example_mnd_msgs, example_chat_msgs
+def experimental_prompt(bundle, llm):
+    # Rendered prompts are kept per persona budget, so compared models with different
+    # context windows each get their own, until the uploads change
+    prompt_key = (bundle.key, persona_budget(llm) // 4)
+    prompts = st.session_state.get('experimental_prompts', {})
+    if prompt_key not in prompts:
+        prompts = {key: prompt for key, prompt in prompts.items() if key[0] == bundle.key}
+        prompts[prompt_key] = render_prompt(bundle, prompt_key[1])
+        st.session_state['experimental_prompts'] = prompts
+    return prompts[prompt_key]
 
 def send_emojis():
-    with open('emojis.json', 'r', encoding='utf-8') as f:
-        emoji_json = json.load(f)
+    emoji_json = read_emojis()
     emoji_keys = list(emoji_json.keys())
     emoji_keys.insert(0, "None")
     emoji_selecter = st.sidebar.selectbox("Choose an emoji:", emoji_keys, index=0)
@@ -53,40 +48,46 @@ def send_emojis():
 def voice_input():
     voice_input = st.sidebar.checkbox("Enable Voice Input")
     if voice_input:
+        # Speech recognition and URL fetching are only imported once voice input is used
+        from speech_to_text import transcription_status
+        from audio_fetch import fetch_audio_url
         audio_upload_type = st.sidebar.radio("Upload audio file from:", ("Local", "URL"))
         if audio_upload_type == "Local":
             audio_file = st.sidebar.file_uploader("Upload an audio file", type=['wav', 'mp3'])
         else:
             audio_url = st.sidebar.text_input("Enter audio URL:")
             if audio_url:
-                response = requests.get(audio_url)
-                audio_file = response.content
+                # Downloaded with timeouts and a size cap, and cached by URL
+                audio_file = fetch_audio_url(audio_url)
             else:
                 audio_file = None
 
         if audio_file is not None:
             st.sidebar.audio(audio_file)
-            # Convert the uploaded file to BytesIO
-            audio_data = BytesIO(audio_file.getvalue())
-            # Process the audio file
-            recognized_text = recognize_speech(audio_data)
+            # Transcribe the audio file in the background
+            recognized_text = transcription_status(audio_file.getvalue())
             # Button to copy text to clipboard
-            if st.sidebar.button("Copy recognized text to Clipboard"):
+            if recognized_text is not None and st.sidebar.button("Copy recognized text to Clipboard"):
+                import pyperclip
                 pyperclip.copy(recognized_text)
                 st.sidebar.success("Copied to clipboard!")
 
 def load_chat_history(mnd, chatter):
-    if 'chat_histories' in st.session_state and not st.session_state['chat_histories'].empty:
-        df = st.session_state['chat_histories']
-        his_chats = df[(df['MNDName'] == mnd) & (df['Chatter'] == chatter)]
-        for _, row in his_chats.iterrows():
-            if row['Sender'] == mnd:
-                st.chat_message('user').write(row['Message'])
-            else:
-                st.chat_message('assistant').write(row['Message'])
+    # Load the saved conversation the first time it is opened
+    with timed('load_chat_history') as sample:
+        load_persisted_conversation(get_chat_store(), get_chat_database(), mnd, chatter)
+        if not get_chat_store().empty:
+            his_chats = get_chat_store().conversation(mnd, chatter)
+            sample['rows'] = len(his_chats)
+            for _, row in his_chats.iterrows():
+                if row['Sender'] == mnd:
+                    st.chat_message('user').write(row['Message'])
+                else:
+                    st.chat_message('assistant').write(row['Message'])
 
+@instrument('store_message')
 def store_message(mnd, chatter, tag, subtag, message, sender):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    timestamp = datetime.now()
     new_chat = {
         'MNDName': mnd,
         'Chatter': chatter,
@@ -96,9 +97,8 @@ def store_message(mnd, chatter, tag, subtag, message, sender):
         'Message': message,
         'Sender': sender
     }
-    current_record = st.session_state['chat_histories'].to_dict('records')
-    current_record.append(new_chat)
-    st.session_state['chat_histories'] = pd.DataFrame(current_record)
+    get_chat_store().append(new_chat)
+    get_chat_database().append(new_chat)
     # st.rerun()
                     
 def chat_setup():
@@ -113,35 +113,35 @@ def chat_setup():
     voice_input()
     return tag, subtag, mnd_name, chatter_name
 
-def llama_chat(llama):
+def get_context_builder(mnd, chatter):
+    if 'context_builders' not in st.session_state:
+        st.session_state['context_builders'] = {}
+    if (mnd, chatter) not in st.session_state['context_builders']:
+        st.session_state['context_builders'][(mnd, chatter)] = ContextBuilder(mnd, chatter)
+    builder = st.session_state['context_builders'][(mnd, chatter)]
+    builder.sync(get_chat_store())
+    return builder
+
+def llama_chat(llama, mnd_name, chatter_name):
     # Select the chat mode
     chat_mode = st.sidebar.radio("Select Chat Mode", ['Normal', 'Experimental'])
+    if chat_mode == 'Experimental':
+        persona_bundle = experimental_file_uploader()
+    
+    # Select LLM
+    model_list = list(MODEL_CONTEXT_LIMITS)
+    llm = st.sidebar.selectbox("Select Model", model_list, index=0)
+    stream_response = st.sidebar.checkbox("Stream responses", value=True)
+    compare_models = []
+    if st.sidebar.checkbox("Compare models"):
+        compare_models = st.sidebar.multiselect("Compare with models", [model for model in model_list if model != llm])
     
     # LLaMa API
+    models = [llm] + compare_models
     if chat_mode == 'Normal':
-        prompt_message = "Assist the user kindly and politely."
+        prompt_messages = {model: "Assist the user kindly and politely." for model in models}
     elif chat_mode == 'Experimental':
-        mnd_persona, chatter_persona, example_mnd_msgs, example_chat_msgs = experimental_file_uploader()
-        prompt_message = f"""
-        Create a chatbot model that mimics the communication style of an MND patient using these inputs:
-        1. MND Patient Persona ({mnd_persona}): Traits and speech patterns of an MND patient.
-        2. Relationship Context ({chatter_persona}): Persona of someone close to the MND patient.
-        3. Historical Chat Data:
-        - MND Patient's Previous Messages ({example_mnd_msgs}): Past messages from the MND patient.
-        - Example Chats ({example_chat_msgs}): Previous conversations between the MND patient and the other.
-        The chatbot's task is to generate one-sentence, informal responses to new messages from the normal person.
-        Responses should reflect the MND patient's usual language and be appropriate to their relationship with the sender.
-        The output should be limited to a single sentence response without additional explanations.
-        """
-    
-    # Select LLM
-    model_list = ["llama-7b-chat", "llama-7b-32k", "llama-13b-chat", "llama-70b-chat",
-                  "mixtral-8x7b-instruct", "mistral-7b-instruct", "mistral-7b",
-                  "Nous-Hermes-Llama2-13b", "falcon-7b-instruct", "falcon-40b-instruct",
-                  "alpaca-7b", "codellama-7b-instruct", "codellama-13b-instruct",
-                  "codellama-34b-instruct", "openassistant-llama2-70b",
-                  "vicuna-7b", "vicuna-13b", "vicuna-13b-16k"]
-    llm = st.sidebar.selectbox("Select Model", model_list, index=0)
+        prompt_messages = {model: experimental_prompt(persona_bundle, model) for model in models}
     
     # Get user message
     user_input = st.chat_input("Type your message here...")
@@ -151,30 +151,56 @@ def llama_chat(llama):
         user_message = st.chat_message("user")
         user_message.write(user_input)
         
-        # Define the API request JSON
-        api_request_json = {
-            "model": llm,
-            "messages": [
-                {"role": "system", "content": prompt_message},
-                {"role": "user", "content": user_input},
-            ],
-            "stream": False,
-        }
+        # Define the API request JSON of every model
+        builder = get_context_builder(mnd_name, chatter_name)
+        api_requests = [{
+            "model": model,
+            # Recent turns of this conversation, fitted into this model's context window
+            "messages": builder.build(model, prompt_messages[model], user_input),
+            "stream": stream_response,
+        } for model in models]
         
-        # Execute the API request
-        response = llama.run(api_request_json)
-        # Get the response
-        answer = response.json()["choices"][0]["message"]["content"]
-        if answer.startswith('"'):
-            answer = answer[1:]
-        if answer.endswith('"'):
-            answer = answer[:-1]
-        # Display the response
-        assistent_message = st.chat_message("assistant")
-        assistent_message.write(answer)
+        runner = get_async_runner()
+        with timed('llama.run') as sample:
+            sample['rows'] = len(api_requests[0]['messages'])
+            answer = llama_answer(llama, runner, api_requests, stream_response)
         
     return user_input, answer
 
+def llama_answer(llama, runner, api_requests, stream_response):
+    api_request_json = api_requests[0]
+    if len(api_requests) > 1:
+        # Ask every selected model in parallel and show the answers side by side,
+        # only the answer of the main model gets stored
+        results = runner.run(runner.compare(llama, api_requests))
+        for column, result in zip(st.columns(len(results)), results):
+            with column:
+                st.caption(f"{result['model']} ({result['latency']:.2f}s)")
+                if result['error']:
+                    st.error(result['error'])
+                else:
+                    st.chat_message("assistant").write(result['answer'])
+        answer = results[0]['answer']
+    elif stream_response:
+        # Display the tokens as they arrive, only the final text of a complete answer gets stored
+        stream = runner.stream(llama, api_request_json)
+        assistent_message = st.chat_message("assistant")
+        answer = assistent_message.write_stream(strip_quotes_stream(stream))
+        if stream.error:
+            st.error(f"The model did not answer: {stream.error}")
+            answer = None
+    else:
+        # Execute the API request with timeout and retries
+        result = runner.run(runner.complete(llama, api_request_json))
+        if result['error']:
+            st.error(f"The model did not answer: {result['error']}")
+        else:
+            # Display the response
+            assistent_message = st.chat_message("assistant")
+            assistent_message.write(result['answer'])
+        answer = result['answer']
+    return answer
+
 def get_api_key():
     # Get the API Key
     if 'api_key' not in st.session_state:
@@ -187,21 +213,48 @@ def get_api_key():
             api_key = api_file.getvalue().decode("utf-8").strip()
             st.session_state['api_key'] = api_key
 
+@st.cache_resource(show_spinner=False)
+def get_client_pool():
+    # The HTTP client stack is only imported once an API key is available
+    from llm_client import LlamaClientPool
+    # Answer with a local fake model when running offline
+    if os.environ.get("LLAMA_FAKE_BACKEND"):
+        from llm_stream import FakeLlamaAPI
+        # LLAMA_FAKE_DELAY sets the seconds between streamed tokens, 0 answers at once
+        delay = float(os.environ.get("LLAMA_FAKE_DELAY", 0.02))
+        return LlamaClientPool(client_factory=lambda api_token: FakeLlamaAPI(api_token, token_delay=delay, first_token_delay=delay * 10))
+    return LlamaClientPool()
+
+@st.cache_resource(show_spinner=False)
+def get_async_runner():
+    from llm_async import AsyncLLMRunner
+    return AsyncLLMRunner()
+
+@st.cache_resource(show_spinner=False)
+def get_completion_cache():
+    from llm_cache import CompletionCache, DEFAULT_TTL
+    # Set LLM_CACHE_PATH to also keep cached completions in a SQLite file across restarts
+    ttl = float(os.environ.get("LLM_CACHE_TTL", DEFAULT_TTL))
+    return CompletionCache(ttl=ttl, db_path=os.environ.get("LLM_CACHE_PATH"))
+
 def llama_init(api_key):
-    # Function to asynchronously initialize Llama API and handle requests
-    async def init_llama_api(api_key):
-        llama = LlamaAPI(api_key)
+    # Clients live in a process-wide pool so their connections survive reruns and sessions
+    return get_client_pool().get(api_key)
+
+def cached_llama(llama, mnd, chatter):
+    if st.sidebar.checkbox("Bypass response cache"):
         return llama
-    
-    # Create a new event loop for the async task
-    new_loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(new_loop)
-    llama = None
-    try:
-        llama = new_loop.run_until_complete(init_llama_api(api_key))
-    finally:
-        new_loop.close()
-    return llama
+    from llm_cache import CachedLlamaClient
+    replay = st.sidebar.checkbox("Replay cached answers", help="Answer a repeated message of this conversation from the cache even when the earlier turns differ.")
+    return CachedLlamaClient(llama, get_completion_cache(), conversation=(mnd, chatter) if replay else None)
+
+def show_pool_stats():
+    stats = get_client_pool().stats()
+    st.sidebar.caption(f"LLM clients: {stats['clients']} active, {stats['hits']} pool hits, "
+                       f"{stats['created']} created, {stats['connections']} connections opened")
+    stats = get_completion_cache().stats()
+    st.sidebar.caption(f"Response cache: {stats['hit_rate']:.0%} hit rate ({stats['hits']} hits, "
+                       f"{stats['misses']} misses, {stats['entries']} cached)")
 
 def llm_chat_main():
     get_api_key()
@@ -212,9 +265,12 @@ def llm_chat_main():
         # If successfully initialized, run the llama chat
         if llama:
             tag, subtag, mnd_name, chatter_name = chat_setup()
+            llama = cached_llama(llama, mnd_name, chatter_name)
             load_chat_history(mnd_name, chatter_name)
             # Chat Interface
-            user_input, answer = llama_chat(llama)
+            user_input, answer = llama_chat(llama, mnd_name, chatter_name)
+            show_pool_stats()
+            perf_panel()
             # Store the chat history
             if user_input:
                 store_message(mnd_name, chatter_name, tag, subtag, user_input, chatter_name)
@@ -0,0 +1,18 @@
+import streamlit as st
+from chat_components import ChatComponents
+from chat_tags import CHAT_TAGS, DEFAULT_TAG
+
+def select_tag():
+    # The selected tag is kept in the URL, e.g. ?tag=friend, so each relationship can be linked to
+    tag = st.query_params.get("tag", DEFAULT_TAG)
+    tags = list(CHAT_TAGS)
+    tag = st.sidebar.selectbox("Chat with:", tags, index=tags.index(tag) if tag in tags else 0, format_func=CHAT_TAGS.get)
+    st.query_params["tag"] = tag
+    return tag
+
+# Check for current user and load or initialize chat history
+if 'current_user' in st.session_state and st.session_state['current_user']:
+    chat = ChatComponents(st.session_state['current_user'], select_tag(), "./chat_history.csv")
+    chat.run()
+else:
+    st.error("Please log in to access the chat.")
@@ -0,0 +1,84 @@
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Number of samples per stage the session aggregates are computed over
+STAGE_WINDOW = 200
+_log_lock = threading.Lock()
+
+def log_path():
+    # Set CHAT_PERF_LOG to append every sample to a JSON-lines file
+    return os.environ.get("CHAT_PERF_LOG")
+
+def panel_enabled():
+    # Set CHAT_PERF_PANEL to show the timings in the sidebar
+    return bool(os.environ.get("CHAT_PERF_PANEL"))
+
+def session_samples():
+    if 'perf_samples' not in st.session_state:
+        st.session_state['perf_samples'] = {}
+    return st.session_state['perf_samples']
+
+def record(stage, seconds, rows=None):
+    sample = {'stage': stage, 'time': time.time(), 'seconds': seconds, 'rows': rows}
+    # Samples taken outside a script run, e.g. in background threads, only go to the log
+    if get_script_run_ctx() is not None:
+        session_samples().setdefault(stage, deque(maxlen=STAGE_WINDOW)).append(sample)
+    path = log_path()
+    if path:
+        with _log_lock, open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(sample) + "\n")
+    return sample
+
+@contextmanager
+def timed(stage):
+    # Time the block, the caller can fill in sample['rows'] with the size of the data it handled
+    sample = {'rows': None}
+    start = time.perf_counter()
+    try:
+        yield sample
+    finally:
+        record(stage, time.perf_counter() - start, sample['rows'])
+
+def instrument(stage):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with timed(stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+def stage_summary():
+    summary = []
+    for stage, samples in session_samples().items():
+        seconds = [sample['seconds'] for sample in samples]
+        summary.append({
+            'stage': stage,
+            'count': len(seconds),
+            'last ms': seconds[-1] * 1000,
+            'p50 ms': percentile(seconds, 50) * 1000,
+            'p95 ms': percentile(seconds, 95) * 1000,
+            'rows': samples[-1]['rows'],
+        })
+    return summary
+
+def perf_panel():
+    if not panel_enabled():
+        return
+    with st.sidebar.expander("Performance"):
+        summary = stage_summary()
+        if summary:
+            st.dataframe(summary, hide_index=True)
+        else:
+            st.caption("No timings recorded yet")
@@ -0,0 +1,69 @@
+import hashlib
+import json
+from dataclasses import dataclass
+from llm_context import truncate_to_tokens, take_examples
+
+EXPERIMENTAL_PROMPT = """
+        Create a chatbot model that mimics the communication style of an MND patient using these inputs:
+        1. MND Patient Persona ({mnd_persona}): Traits and speech patterns of an MND patient.
+        2. Relationship Context ({chatter_persona}): Persona of someone close to the MND patient.
+        3. Historical Chat Data:
+        - MND Patient's Previous Messages ({example_mnd_msgs}): Past messages from the MND patient.
+        - Example Chats ({example_chat_msgs}): Previous conversations between the MND patient and the other.
+        The chatbot's task is to generate one-sentence, informal responses to new messages from the normal person.
+        Responses should reflect the MND patient's usual language and be appropriate to their relationship with the sender.
+        The output should be limited to a single sentence response without additional explanations.
+        """
+
+@dataclass(frozen=True)
+class PersonaBundle:
+    # Parsed Experimental-mode inputs, any of them is None until its file is uploaded
+    key: tuple
+    mnd_persona: str = None
+    chatter_persona: str = None
+    example_mnd_msgs: tuple = None
+    example_chat_msgs: tuple = None
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest() if data is not None else None
+
+def parse_persona(data):
+    # Normalize the persona JSON into a compact single-line string
+    return json.dumps(json.loads(data))
+
+def parse_example_mnd_msgs(data):
+    return tuple(line for line in data.decode("utf-8").split("\n") if line.strip() != "")
+
+def parse_example_chat_msgs(data):
+    example_chat_msgs = []
+    for line in data.decode("utf-8").split("\n"):
+        if line.strip() == "":
+            continue
+        # Only split on the first colon, the message itself may contain more
+        chatter, sep, content = line.partition(":")
+        if not sep:
+            chatter, content = "", line
+        example_chat_msgs.append({"chatter": chatter, "content": content.strip().replace('"', "")})
+    return tuple(example_chat_msgs)
+
+def parse_bundle(mnd_persona, chatter_persona, example_mnd_msgs, example_chat_msgs):
+    # Takes the raw bytes of each upload (or None)
+    key = tuple(content_hash(data) for data in (mnd_persona, chatter_persona, example_mnd_msgs, example_chat_msgs))
+    return PersonaBundle(
+        key=key,
+        mnd_persona=parse_persona(mnd_persona) if mnd_persona is not None else None,
+        chatter_persona=parse_persona(chatter_persona) if chatter_persona is not None else None,
+        example_mnd_msgs=parse_example_mnd_msgs(example_mnd_msgs) if example_mnd_msgs is not None else None,
+        example_chat_msgs=parse_example_chat_msgs(example_chat_msgs) if example_chat_msgs is not None else None,
+    )
+
+def render_prompt(bundle, section_budget):
+    # Each persona and example input only gets its share of the model's context
+    example_mnd_msgs = take_examples(bundle.example_mnd_msgs, section_budget)
+    example_chat_msgs = take_examples(bundle.example_chat_msgs, section_budget)
+    return EXPERIMENTAL_PROMPT.format(
+        mnd_persona=truncate_to_tokens(bundle.mnd_persona, section_budget),
+        chatter_persona=truncate_to_tokens(bundle.chatter_persona, section_budget),
+        example_mnd_msgs=example_mnd_msgs,
+        example_chat_msgs=example_chat_msgs,
+    )
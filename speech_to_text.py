@@ -1,23 +1,182 @@
 import speech_recognition as sr
 import streamlit as st
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from io import BytesIO
+from perf import record
 
-def recognize_speech(audio_path):
-    # Initialize the recognizer
-    r = sr.Recognizer()
-    
-    source = sr.AudioFile(audio_path)
+# Number of transcriptions kept in the process-wide cache
+MAX_CACHED_TRANSCRIPTIONS = 128
+TRANSCRIPTION_WORKERS = 2
+# Long audio is cut into chunks of this many seconds that are transcribed concurrently
+CHUNK_SECONDS = 15
+CHUNK_WORKERS = 4
+# Seconds between sidebar status checks while a transcription is pending
+POLL_INTERVAL = 1
 
+class TranscriptionError(Exception):
+    pass
+
+class UnrecognizedSpeechError(TranscriptionError):
+    pass
+
+# Recognizer backends take the recognizer and the recorded audio and return the text
+def google_backend(recognizer, audio):
+    return recognizer.recognize_google(audio)
+
+def sphinx_backend(recognizer, audio):
+    # Offline engine, needs the pocketsphinx package
+    return recognizer.recognize_sphinx(audio)
+
+def stub_backend(recognizer, audio):
+    # Local stand-in used to run the voice input without any speech service
+    return f"stub transcription of {len(audio.frame_data)} bytes of audio"
+
+SPEECH_BACKENDS = {
+    "google": google_backend,
+    "sphinx": sphinx_backend,
+    "stub": stub_backend,
+}
+
+def get_backend(name=None):
+    return SPEECH_BACKENDS[name or os.environ.get("SPEECH_BACKEND", "google")]
+
+def recognize(audio, backend):
+    try:
+        # Recognize the content of the audio
+        return backend(sr.Recognizer(), audio)
+    except sr.UnknownValueError:
+        # API was unable to understand the audio
+        raise UnrecognizedSpeechError("Speech recognition could not understand the audio")
+    except sr.RequestError as e:
+        # The API was unreachable or unresponsive
+        raise TranscriptionError(f"Could not request results from the speech recognition service; {e}")
+
+def transcribe(audio_path, backend=None):
     # Use the audio file as the audio source
-    with source as s:
+    with sr.AudioFile(audio_path) as s:
         # Record the audio file
-        audio = r.record(s)
+        audio = sr.Recognizer().record(s)
+    return recognize(audio, backend or get_backend())
+
+class TranscriptionWorker:
+    # Transcribes audio on a thread pool and caches the results by the SHA-256 of the audio bytes.
+    # Each file is read chunk by chunk and the chunks are transcribed concurrently, so only
+    # a bounded number of recorded chunks is held in memory however long the file is
+    def __init__(self, backend=None, max_workers=TRANSCRIPTION_WORKERS, chunk_workers=CHUNK_WORKERS,
+                 chunk_seconds=CHUNK_SECONDS, max_cached=MAX_CACHED_TRANSCRIPTIONS):
+        self.backend = backend
+        self.chunk_seconds = chunk_seconds
+        self.chunk_workers = chunk_workers
+        self.max_cached = max_cached
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speech-to-text")
+        self.chunk_executor = ThreadPoolExecutor(max_workers=chunk_workers, thread_name_prefix="speech-to-text-chunk")
+        self.results = OrderedDict()
+        self.lock = threading.Lock()
 
+    def submit(self, audio_bytes):
+        key = hashlib.sha256(audio_bytes).hexdigest()
+        with self.lock:
+            # Failures that may be transient, e.g. an unreachable service, are tried again
+            if key in self.results and not (self.results[key]['status'] == 'error' and self.results[key]['retry']):
+                self.results.move_to_end(key)
+                return key
+            self.results.pop(key, None)
+            self.results[key] = {'status': 'pending', 'text': None, 'error': None, 'retry': False, 'chunks': [], 'seconds': None}
+            while len(self.results) > self.max_cached:
+                self.results.popitem(last=False)
+        self.executor.submit(self.run, key, audio_bytes)
+        return key
+
+    def update(self, key, **values):
+        with self.lock:
+            if key in self.results:
+                self.results[key].update(values)
+
+    def run_chunk(self, key, index, audio, backend, in_flight):
+        try:
+            text = recognize(audio, backend)
+        except UnrecognizedSpeechError:
+            # A chunk of silence is not an error for the whole file
+            text = ""
+        finally:
+            in_flight.release()
+        with self.lock:
+            if key in self.results:
+                self.results[key]['chunks'][index] = text
+
+    def run(self, key, audio_bytes):
+        backend = self.backend or get_backend()
+        # At most two chunks per worker are recorded ahead of the transcription
+        in_flight = threading.Semaphore(self.chunk_workers * 2)
+        start = time.perf_counter()
         try:
-            # Recognize the content of the audio
-            return r.recognize_google(audio)
-        except sr.UnknownValueError:
-            # API was unable to understand the audio
-            st.sidebar.error("Google Speech Recognition could not understand the audio")
-        except sr.RequestError as e:
-            # The API was unreachable or unresponsive
-            st.sidebar.error(f"Could not request results from Google Speech Recognition service; {e}")
+            with sr.AudioFile(BytesIO(audio_bytes)) as s:
+                chunk_count = max(1, math.ceil(s.DURATION / self.chunk_seconds))
+                self.update(key, chunks=[None] * chunk_count)
+                recognizer = sr.Recognizer()
+                futures = []
+                for index in range(chunk_count):
+                    in_flight.acquire()
+                    # Each record call continues where the previous chunk ended
+                    audio = recognizer.record(s, duration=self.chunk_seconds)
+                    futures.append(self.chunk_executor.submit(self.run_chunk, key, index, audio, backend, in_flight))
+            wait(futures)
+            for future in futures:
+                future.result()
+            text = " ".join(chunk for chunk in self.result(key)['chunks'] if chunk)
+            if not text:
+                raise UnrecognizedSpeechError("Speech recognition could not understand the audio")
+            self.update(key, status='done', text=text, seconds=time.perf_counter() - start)
+        except UnrecognizedSpeechError as e:
+            # The same audio would not be understood on another try either
+            self.update(key, status='error', error=str(e), seconds=time.perf_counter() - start)
+        except Exception as e:
+            self.update(key, status='error', error=str(e), retry=True, seconds=time.perf_counter() - start)
+
+    def result(self, key):
+        with self.lock:
+            result = self.results.get(key, {'status': 'pending', 'text': None, 'error': None, 'retry': False, 'chunks': [], 'seconds': None})
+            return {**result, 'chunks': list(result['chunks'])}
+
+@st.cache_resource(show_spinner=False)
+def get_transcription_worker():
+    return TranscriptionWorker()
+
+@st.fragment(run_every=POLL_INTERVAL)
+def wait_for_transcription(key):
+    result = get_transcription_worker().result(key)
+    if result['status'] == 'pending':
+        finished = [chunk for chunk in result['chunks'] if chunk is not None]
+        st.info(f"Transcribing audio... ({len(finished)}/{len(result['chunks']) or '?'} chunks)")
+        # Show the text of the chunks finished so far
+        partial_text = " ".join(chunk for chunk in finished if chunk)
+        if partial_text:
+            st.markdown(partial_text)
+    else:
+        # Rerun the whole page so it can show the recognized text
+        st.rerun()
+
+def transcription_status(audio_bytes):
+    # Queue the audio for transcription and report its status in the sidebar,
+    # returns the recognized text once it is available
+    worker = get_transcription_worker()
+    key = worker.submit(audio_bytes)
+    result = worker.result(key)
+    if result['seconds'] is not None and key not in st.session_state.setdefault('timed_transcriptions', set()):
+        # The transcription ran in the background, its time is recorded once it is first seen
+        st.session_state['timed_transcriptions'].add(key)
+        record('recognize_speech', result['seconds'], len(result['chunks']))
+    if result['status'] == 'pending':
+        with st.sidebar:
+            wait_for_transcription(key)
+    elif result['status'] == 'error':
+        st.sidebar.error(result['error'])
+    else:
+        st.sidebar.success("Transcription done")
+    return result['text']
@@ -0,0 +1,72 @@
+import os
+import pytest
+from audio_fetch import AudioFetcher, AudioFetchError, LocalAudioServer
+
+class RecordingSession:
+    # Wraps the fetcher's session to record the status of every response
+    def __init__(self, http):
+        self.http = http
+        self.statuses = []
+
+    def get(self, url, **kwargs):
+        response = self.http.get(url, **kwargs)
+        self.statuses.append(response.status_code)
+        return response
+
+@pytest.fixture(scope="module")
+def assets(tmp_path_factory):
+    return tmp_path_factory.mktemp("assets")
+
+@pytest.fixture(scope="module")
+def server(assets):
+    (assets / "voice.wav").write_bytes(b"RIFF" + b"\x00" * 1000)
+    with LocalAudioServer(directory=str(assets)) as server:
+        yield server
+
+def recording_fetcher(**kwargs):
+    fetcher = AudioFetcher(**kwargs)
+    fetcher.http = RecordingSession(fetcher.http)
+    return fetcher
+
+def test_fresh_downloads_are_served_from_the_cache(server):
+    fetcher = recording_fetcher()
+    first = fetcher.fetch(server.url("voice.wav")).getvalue()
+    assert fetcher.fetch(server.url("voice.wav")).getvalue() == first
+    assert fetcher.http.statuses == [200]
+
+def test_stale_downloads_are_revalidated(server):
+    fetcher = recording_fetcher(revalidate_after=0)
+    first = fetcher.fetch(server.url("voice.wav")).getvalue()
+    assert fetcher.fetch(server.url("voice.wav")).getvalue() == first
+    assert fetcher.http.statuses == [200, 304]
+
+def test_changed_files_are_downloaded_again(server, assets):
+    path = assets / "changed.wav"
+    path.write_bytes(b"RIFF" + b"\x00" * 1000)
+    fetcher = recording_fetcher(revalidate_after=0)
+    fetcher.fetch(server.url("changed.wav"))
+    path.write_bytes(b"RIFF" + b"\x01" * 1000)
+    # Move the modification time past the one the cached copy was served with
+    mtime = path.stat().st_mtime + 60
+    os.utime(path, (mtime, mtime))
+    assert fetcher.fetch(server.url("changed.wav")).getvalue() == b"RIFF" + b"\x01" * 1000
+    assert fetcher.http.statuses == [200, 200]
+
+def test_files_over_the_size_limit_are_rejected(server):
+    fetcher = AudioFetcher(max_bytes=100)
+    with pytest.raises(AudioFetchError, match="byte limit"):
+        fetcher.fetch(server.url("voice.wav"))
+    assert not fetcher.cache
+
+def test_missing_files_raise(server):
+    with pytest.raises(AudioFetchError, match="HTTP 404"):
+        AudioFetcher().fetch(server.url("missing.wav"))
+
+def test_cache_is_bounded_by_total_bytes(server, assets):
+    for name in ("a.wav", "b.wav", "c.wav"):
+        (assets / name).write_bytes(b"\x00" * 1000)
+    fetcher = AudioFetcher(max_cached_bytes=2500)
+    for name in ("a.wav", "b.wav", "c.wav"):
+        fetcher.fetch(server.url(name))
+    assert list(fetcher.cache) == [server.url("b.wav"), server.url("c.wav")]
+    assert fetcher.size == 2000
@@ -0,0 +1,36 @@
+import gzip
+import io
+import pandas as pd
+import pytest
+from chat_export import available_formats, export_bytes, export_file_name
+from chat_store import COLUMNS, ChatStore
+
+@pytest.fixture
+def history():
+    return ChatStore(pd.DataFrame([
+        ["alice", "emily", "Family", "Wife", "2024-01-01 09:00:00", "good morning, love", "emily"],
+        ["alice", "emily", "Family", "Wife", "2024-01-01 09:05:00", "morning! 😊", "alice"],
+    ], columns=COLUMNS)).frame
+
+def test_csv_export_keeps_the_upload_layout(history):
+    exported = export_bytes(history, "CSV").decode("utf-8")
+    assert exported.splitlines() == [
+        ",".join(COLUMNS),
+        'alice,emily,Family,Wife,2024-01-01 09:00:00,"good morning, love",emily',
+        "alice,emily,Family,Wife,2024-01-01 09:05:00,morning! 😊,alice",
+    ]
+
+def test_gzip_export_compresses_the_csv(history):
+    assert gzip.decompress(export_bytes(history, "CSV (gzip)")) == export_bytes(history, "CSV")
+
+def test_parquet_export_round_trips(history):
+    if "Parquet" not in available_formats():
+        pytest.skip("pyarrow is not installed")
+    exported = pd.read_parquet(io.BytesIO(export_bytes(history, "Parquet")))
+    assert exported['Message'].tolist() == history['Message'].tolist()
+    assert isinstance(exported['Chatter'].dtype, pd.CategoricalDtype)
+
+def test_file_name_follows_the_upload():
+    assert export_file_name("chat_history.csv", "CSV") == "updated_chat_history.csv"
+    assert export_file_name("chat_history.CSV", "CSV (gzip)") == "updated_chat_history.csv.gz"
+    assert export_file_name("export", "Parquet") == "updated_export.parquet"
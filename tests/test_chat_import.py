@@ -0,0 +1,41 @@
+import io
+import pytest
+from chat_import import ChatImportError, import_chat_history
+
+HEADER = "MNDName,Chatter,Tag,SubTag,Timestamp,Message,Sender\n"
+ROWS = (
+    "alice,emily,Family,Wife,2024-01-01 09:00:00,good morning,emily\n"
+    "bob,carl,Friends,School,2024/01/02 18:30,\"dinner, tomorrow?\",bob\n"
+    "alice,emily,Family,Wife,2024-01-03 20:00:00,,alice\n"
+)
+
+def test_rows_are_sharded_by_user():
+    shards = import_chat_history(io.BytesIO((HEADER + ROWS).encode("utf-8")), chunk_rows=2)
+    assert sorted(shards) == ["alice", "bob"]
+    assert shards["alice"].conversation("alice", "emily")['Message'].tolist() == ["good morning", ""]
+    assert str(shards["bob"].frame['Timestamp'].iloc[0]) == "2024-01-02 18:30:00"
+
+def test_user_filter_keeps_only_their_rows():
+    shards = import_chat_history(io.BytesIO((HEADER + ROWS).encode("utf-8")), user="bob")
+    assert list(shards) == ["bob"]
+    assert len(shards["bob"]) == 1
+
+def test_progress_is_reported():
+    class Upload(io.BytesIO):
+        size = len(HEADER + ROWS)
+    done = []
+    import_chat_history(Upload((HEADER + ROWS).encode("utf-8")), chunk_rows=1, progress=done.append)
+    assert done == sorted(done)
+    assert done[-1] == 1.0
+
+@pytest.mark.parametrize("content", [
+    "MNDName,Chatter,Tag,SubTag,Timestamp,Message\nalice,emily,Family,Wife,2024-01-01 09:00:00,hi\n",
+    "Chatter,MNDName,Tag,SubTag,Timestamp,Message,Sender\n",
+])
+def test_wrong_columns_are_rejected(content):
+    with pytest.raises(ChatImportError, match="correct columns"):
+        import_chat_history(io.BytesIO(content.encode("utf-8")))
+
+def test_empty_files_are_rejected():
+    with pytest.raises(ChatImportError, match="empty"):
+        import_chat_history(io.BytesIO(b""))
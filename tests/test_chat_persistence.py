@@ -0,0 +1,63 @@
+from datetime import datetime
+import pytest
+from chat_persistence import ChatDatabase, load_persisted_conversation, load_persisted_history
+from chat_store import ChatCursor, ChatStore, SharedChatStore
+
+def message(chatter, timestamp, text, sender=None, mnd="alice", tag="Family"):
+    return {'MNDName': mnd, 'Chatter': chatter, 'Tag': tag, 'SubTag': "Wife",
+            'Timestamp': timestamp, 'Message': text, 'Sender': sender or chatter}
+
+@pytest.fixture
+def database(tmp_path):
+    return ChatDatabase(str(tmp_path / "chat_history.sqlite3"), flush_interval=0.01)
+
+def test_messages_round_trip(database):
+    database.append(message("emily", datetime(2024, 1, 1, 9, 0), "good morning"))
+    database.append(message("emily", datetime(2024, 1, 1, 9, 5), "morning!", sender="alice"))
+    database.append(message("bob", datetime(2024, 1, 2, 18, 30), "dinner?", tag="Friends"))
+    assert database.flush()
+    conversation = database.load_conversation("alice", "emily")
+    assert conversation['Timestamp'].tolist() == ["2024-01-01 09:00:00", "2024-01-01 09:05:00"]
+    assert conversation['Message'].tolist() == ["good morning", "morning!"]
+    assert database.chatters("alice", "Friends") == ["bob"]
+    assert database.contacts("alice") == ["emily", "bob"]
+    assert set(database.tags(["alice"])) == {"Family", "Friends"}
+    assert database.tags([]) == []
+
+def test_messages_survive_reopening(database):
+    database.append(message("emily", datetime(2024, 1, 1, 9, 0), "good morning"))
+    assert database.flush()
+    reopened = ChatDatabase(database.path)
+    assert reopened.load_conversation("alice", "emily")['Message'].tolist() == ["good morning"]
+
+def test_writer_survives_a_failing_batch(database):
+    database.db.execute("CREATE TRIGGER reject BEFORE INSERT ON messages WHEN NEW.Message = 'poison' "
+                        "BEGIN SELECT RAISE(ABORT, 'rejected'); END")
+    database.append(message("emily", datetime(2024, 1, 1, 9, 0), "poison"))
+    assert database.flush()
+    assert database.failed == 1
+    database.append(message("emily", datetime(2024, 1, 1, 9, 5), "still writing"))
+    assert database.flush()
+    assert database.load_conversation("alice", "emily")['Message'].tolist() == ["still writing"]
+
+def test_persisted_conversation_is_loaded_once_without_duplicates(database):
+    sent = [message("emily", datetime(2024, 1, 1, 9, minute), f"message {minute}") for minute in range(3)]
+    for record in sent:
+        database.append(record)
+    # The shard already holds the first message, e.g. from an uploaded export
+    store = ChatStore()
+    store.append(sent[0])
+    shared = SharedChatStore()
+    shared.merge({"alice": store})
+    cursor = ChatCursor(shared, ["alice"])
+    load_persisted_conversation(cursor, database, "alice", "emily")
+    load_persisted_conversation(cursor, database, "alice", "emily")
+    assert cursor.conversation("alice", "emily")['Message'].tolist() == ["message 0", "message 1", "message 2"]
+
+def test_persisted_history_loads_every_contact(database):
+    database.append(message("emily", datetime(2024, 1, 1, 9, 0), "hi emily"))
+    database.append(message("bob", datetime(2024, 1, 1, 9, 1), "hi bob", tag="Friends"))
+    database.append(message("emily", datetime(2024, 1, 1, 9, 2), "not mine", mnd="carol"))
+    cursor = ChatCursor(SharedChatStore(), ["alice"])
+    load_persisted_history(cursor, database)
+    assert cursor.frame['Message'].tolist() == ["hi emily", "hi bob"]
@@ -0,0 +1,96 @@
+import io
+from datetime import datetime
+import pandas as pd
+from chat_export import export_bytes
+from chat_import import import_chat_history
+from chat_store import COLUMNS, ChatCursor, ChatStore, SharedChatStore, format_timestamp
+
+def message(chatter, timestamp, text, sender=None, mnd="alice", tag="Family", subtag="Wife"):
+    return {'MNDName': mnd, 'Chatter': chatter, 'Tag': tag, 'SubTag': subtag,
+            'Timestamp': timestamp, 'Message': text, 'Sender': sender or chatter}
+
+def history():
+    return pd.DataFrame([
+        message("emily", "2024-01-01 09:00:00", "good morning"),
+        message("emily", "2024-01-01 09:05:00", "morning! coffee later?", sender="alice"),
+        message("bob", "2024-01-02 18:30:00", "dinner tomorrow", tag="Friends", subtag="School"),
+        message("emily", "2024-01-03 20:00:00", "coffee was great"),
+    ], columns=COLUMNS)
+
+def as_text(df):
+    # Names come out as categoricals and timestamps as datetimes, compare them as written
+    return df.astype({column: str for column in COLUMNS if column != 'Timestamp'}).assign(
+        Timestamp=df['Timestamp'].map(format_timestamp)).reset_index(drop=True)
+
+def test_extend_and_append_round_trip():
+    df = history()
+    store = ChatStore(df.iloc[:3])
+    store.append(df.iloc[3].to_dict())
+    assert len(store) == 4
+    pd.testing.assert_frame_equal(as_text(store.frame), df)
+
+def test_appended_datetimes_are_stored_as_timestamps():
+    store = ChatStore()
+    store.append(message("emily", datetime(2024, 5, 6, 7, 8, 9, 123456), "hi"))
+    assert store.frame['Timestamp'].iloc[0] == pd.Timestamp("2024-05-06 07:08:09")
+
+def test_conversation_and_contacts():
+    store = ChatStore(history())
+    conversation = store.conversation("alice", "emily")
+    assert list(conversation['Message']) == ["good morning", "morning! coffee later?", "coffee was great"]
+    assert list(store.conversation("alice", "emily", last=1).index) == [3]
+    assert store.conversation_length("alice", "bob") == 1
+    assert store.conversation_offset("alice", "emily", 0) == 3
+    assert store.chatters("alice", "Family") == ["emily"]
+    assert store.subtag("bob") == "School"
+    assert store.tags() == ["Family", "Friends"]
+
+def test_messages_survive_compaction():
+    store = ChatStore()
+    for i in range(2500):
+        store.append(message("emily", "2024-01-01 09:00:00", f"message {i}"))
+    assert store.conversation("alice", "emily")['Message'].tolist() == [f"message {i}" for i in range(2500)]
+
+def test_select_time_range():
+    store = ChatStore(history())
+    selected = store.select(mnd="alice", start="2024-01-01 09:05:00", end="2024-01-03 20:00:00")
+    assert list(selected['Message']) == ["morning! coffee later?", "dinner tomorrow"]
+    assert list(store.select(tag="Friends")['Chatter']) == ["bob"]
+
+def test_search_ranks_and_scopes():
+    store = ChatStore(history())
+    results = store.search("coffee morning", mnd="alice")
+    assert results['Message'].iloc[0] == "morning! coffee later?"
+    assert store.search("coffee", mnd="alice", chatter="bob").empty
+    store.append(message("bob", "2024-01-04 08:00:00", "coffee?", tag="Friends", subtag="School"))
+    assert list(store.search("coffee", mnd="alice", chatter="bob")['Message']) == ["coffee?"]
+
+def test_extend_missing_skips_rows_already_held():
+    df = history()
+    store = ChatStore(df.iloc[:2])
+    store.extend_missing(df)
+    pd.testing.assert_frame_equal(as_text(store.frame), df)
+
+def test_extend_missing_does_not_cache_a_frame():
+    store = ChatStore(history())
+    store.extend_missing(history())
+    assert len(store) == 4
+    assert store._frame is None
+
+def test_merge_keeps_rows_sent_by_other_sessions():
+    shared = SharedChatStore()
+    shared.merge({"alice": ChatStore(history())})
+    cursor = ChatCursor(shared, ["alice"])
+    cursor.append(message("emily", "2024-01-04 10:00:00", "sent from another session", sender="alice"))
+    shared.merge({"alice": ChatStore(history())})
+    assert len(cursor) == 5
+    assert cursor.conversation("alice", "emily")['Message'].iloc[-1] == "sent from another session"
+
+def test_reuploaded_export_does_not_duplicate_sends():
+    shared = SharedChatStore()
+    shared.merge(import_chat_history(io.BytesIO(export_bytes(history(), "CSV"))))
+    cursor = ChatCursor(shared, ["alice"])
+    cursor.append(message("emily", datetime.now(), "hello", sender="alice"))
+    shared.merge(import_chat_history(io.BytesIO(export_bytes(cursor.frame, "CSV"))))
+    assert len(cursor) == 5
+    assert cursor.conversation("alice", "emily")['Message'].tolist().count("hello") == 1
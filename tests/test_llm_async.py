@@ -0,0 +1,97 @@
+import threading
+import time
+import pytest
+from llm_async import AsyncLLMRunner
+from llm_stream import FakeLlamaAPI, FakeResponse, format_stream_chunk
+
+REQUEST = {"model": "llama-7b-chat", "messages": [{"role": "user", "content": "hi"}]}
+
+class FlakyLlama:
+    # Fails the first `failures` requests, then answers like the fake model
+    def __init__(self, failures, after_first_token=False):
+        self.failures = failures
+        self.after_first_token = after_first_token
+        self.calls = 0
+
+    def run(self, api_request_json):
+        self.calls += 1
+        failing = self.calls <= self.failures
+        if not api_request_json.get('stream'):
+            if failing:
+                raise ConnectionError("service unavailable")
+            return FakeResponse({"choices": [{"message": {"content": '"hello"'}}]})
+        return self.chunks(api_request_json["model"], failing)
+
+    def chunks(self, model, failing):
+        if failing and not self.after_first_token:
+            raise ConnectionError("service unavailable")
+        yield format_stream_chunk(model, "hel")
+        if failing:
+            raise ConnectionError("connection reset")
+        yield format_stream_chunk(model, "lo")
+
+class SlowLlama:
+    # Records how many requests run at the same time
+    def __init__(self, delay):
+        self.delay = delay
+        self.running = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def run(self, api_request_json):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(self.delay)
+        with self.lock:
+            self.running -= 1
+        return FakeResponse({"choices": [{"message": {"content": "done"}}]})
+
+@pytest.fixture
+def runner():
+    return AsyncLLMRunner(max_concurrency=2)
+
+def test_complete_strips_quotes(runner):
+    result = runner.run(runner.complete(FakeLlamaAPI(token_delay=0, first_token_delay=0), REQUEST))
+    assert result['answer'] == "Thanks for the message, talk soon!"
+    assert result['error'] is None
+    assert result['attempts'] == 1
+
+def test_complete_retries_failures(runner):
+    llama = FlakyLlama(failures=2)
+    result = runner.run(runner.complete(llama, REQUEST, backoff=0))
+    assert result['answer'] == "hello"
+    assert result['attempts'] == 3
+
+def test_complete_gives_up_after_the_retries(runner):
+    result = runner.run(runner.complete(FlakyLlama(failures=5), REQUEST, retries=1, backoff=0))
+    assert result['answer'] is None
+    assert result['error'] == "service unavailable"
+    assert result['attempts'] == 2
+
+def test_complete_times_out(runner):
+    result = runner.run(runner.complete(SlowLlama(0.5), REQUEST, timeout=0.05, retries=0))
+    assert result['error'] == "request timed out"
+
+def test_compare_sends_each_request(runner):
+    llama = FakeLlamaAPI(token_delay=0, first_token_delay=0)
+    results = runner.run(runner.compare(llama, [{**REQUEST, "model": model} for model in ("llama-7b-chat", "alpaca-7b")]))
+    assert [result['model'] for result in results] == ["llama-7b-chat", "alpaca-7b"]
+
+def test_concurrency_is_capped(runner):
+    llama = SlowLlama(0.05)
+    assert all(result['answer'] == "done" for result in runner.run(runner.compare(llama, [REQUEST] * 6)))
+    assert llama.peak == 2
+
+def test_stream_retries_before_the_first_token(runner):
+    stream = runner.stream(FlakyLlama(failures=1), REQUEST, backoff=0)
+    assert "".join(stream) == "hello"
+    assert stream.error is None
+    assert stream.attempts == 2
+
+def test_stream_is_not_retried_after_the_first_token(runner):
+    llama = FlakyLlama(failures=1, after_first_token=True)
+    stream = runner.stream(llama, REQUEST, backoff=0)
+    assert "".join(stream) == "hel"
+    assert stream.error == "connection reset"
+    assert llama.calls == 1
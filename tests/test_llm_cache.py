@@ -0,0 +1,62 @@
+from llm_cache import CachedLlamaClient, CompletionCache, completion_key
+from llm_stream import FakeLlamaAPI, iter_chunks, parse_stream_chunks
+
+def request(*turns, model="llama-7b-chat", system="Assist the user kindly and politely."):
+    messages = [{"role": "system", "content": system}]
+    messages += [{"role": "user" if i % 2 == 0 else "assistant", "content": turn} for i, turn in enumerate(turns)]
+    return {"model": model, "messages": messages}
+
+def test_key_covers_the_whole_conversation():
+    assert completion_key(request("hi")) == completion_key(request("hi"))
+    assert completion_key(request("hi", "hello", "yes")) != completion_key(request("bye", "see you", "yes"))
+    assert completion_key(request("hi")) != completion_key(request("hi", model="alpaca-7b"))
+
+def test_replay_key_ignores_history_within_a_conversation_only():
+    emily, bob = ("alice", "emily"), ("alice", "bob")
+    assert completion_key(request("hi", "hello", "yes"), emily) == completion_key(request("bye", "see you", "yes"), emily)
+    assert completion_key(request("yes"), emily) != completion_key(request("yes"), bob)
+    assert completion_key(request("yes"), emily) != completion_key(request("yes", system="Be brief."), emily)
+
+def test_repeated_requests_are_answered_from_the_cache():
+    cache = CompletionCache()
+    llama = CachedLlamaClient(FakeLlamaAPI(token_delay=0, first_token_delay=0), cache)
+    first = llama.run(request("hi")).json()
+    assert llama.run(request("hi")).json() == first
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+def test_least_recently_used_completions_are_evicted_by_size():
+    cache = CompletionCache(max_bytes=10)
+    cache.put("a", "aaaa")
+    cache.put("b", "bbbb")
+    assert cache.get("a") == "aaaa"
+    cache.put("c", "cccc")
+    assert cache.get("b") is None
+    assert cache.get("a") == "aaaa"
+    assert cache.stats()['bytes'] == 8
+
+def test_expired_completions_are_ignored(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("llm_cache.time.time", lambda: now[0])
+    cache = CompletionCache(ttl=60)
+    cache.put("a", "answer")
+    now[0] += 59
+    assert cache.get("a") == "answer"
+    now[0] += 2
+    assert cache.get("a") is None
+    assert cache.stats()['entries'] == 0
+
+def test_disk_tier_survives_a_new_cache(tmp_path):
+    path = str(tmp_path / "completions.sqlite3")
+    CompletionCache(db_path=path).put("a", "answer")
+    cache = CompletionCache(db_path=path)
+    assert cache.get("a") == "answer"
+    assert cache.stats()['disk_hits'] == 1
+
+def test_streamed_completions_are_cached_once_finished():
+    cache = CompletionCache()
+    llama = CachedLlamaClient(FakeLlamaAPI(token_delay=0, first_token_delay=0), cache)
+    streamed = list(parse_stream_chunks(iter_chunks(llama.run({**request("hi"), "stream": True}))))
+    replayed = list(parse_stream_chunks(iter_chunks(llama.run({**request("hi"), "stream": True}))))
+    assert "".join(replayed) == "".join(streamed)
+    assert cache.stats()['hits'] == 1
@@ -0,0 +1,44 @@
+import json
+from llm_client import LlamaClient, LlamaClientPool
+from llm_stream import parse_stream_chunks
+
+class StreamedResponse:
+    # Stands in for a streamed requests response delivering the body in fixed network chunks
+    status_code = 200
+
+    def __init__(self, body, chunk_bytes):
+        self.chunks = [body[i:i + chunk_bytes] for i in range(0, len(body), chunk_bytes)]
+
+    def iter_content(self, chunk_size=None):
+        return iter(self.chunks)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+def test_stream_decodes_characters_split_between_chunks():
+    reply = ["Love you ", "❤️", " see you soon 😊"]
+    # The server sends the replies as raw UTF-8 rather than \u escapes
+    body = "".join(f"data: {json.dumps({'choices': [{'delta': {'content': token}}]}, ensure_ascii=False)}\n" for token in reply).encode('utf-8')
+    client = LlamaClient("token")
+    for chunk_bytes in (1, 2, 3, 7):
+        client.http.post = lambda url, **kwargs: StreamedResponse(body, chunk_bytes)
+        tokens = list(parse_stream_chunks(client.run({"model": "llama-7b-chat", "messages": [], "stream": True})))
+        assert "".join(tokens) == "".join(reply)
+
+def test_pool_reuses_clients_per_api_key():
+    pool = LlamaClientPool(client_factory=lambda api_token: object())
+    first = pool.get("a")
+    assert pool.get("a") is first
+    assert pool.get("b") is not first
+    assert pool.stats()['created'] == 2
+    assert pool.stats()['hits'] == 1
+
+def test_pool_drops_idle_clients():
+    pool = LlamaClientPool(client_factory=lambda api_token: object(), idle_timeout=0)
+    first = pool.get("a")
+    pool.evict_idle(now=float('inf'))
+    assert pool.get("a") is not first
+    assert pool.stats()['evicted'] == 1
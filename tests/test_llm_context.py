@@ -0,0 +1,43 @@
+from chat_store import ChatCursor, ChatStore, SharedChatStore
+from llm_context import RESPONSE_TOKENS, ContextBuilder, context_budget, message_tokens
+
+def conversation(turns):
+    store = ChatStore()
+    for i in range(turns):
+        store.append({'MNDName': "alice", 'Chatter': "emily", 'Tag': "Family", 'SubTag': "Wife",
+                      'Timestamp': "2024-01-01 09:00:00", 'Message': f"turn {i} " + "word " * 50,
+                      'Sender': "alice" if i % 2 else "emily"})
+    shared = SharedChatStore()
+    shared.merge({"alice": store})
+    return ChatCursor(shared, ["alice"])
+
+def test_context_budget_leaves_room_for_the_reply():
+    assert context_budget("falcon-7b-instruct") == 2048 - RESPONSE_TOKENS
+    assert context_budget("unknown-model") == 4096 - RESPONSE_TOKENS
+
+def test_build_keeps_the_most_recent_turns_within_the_budget():
+    builder = ContextBuilder("alice", "emily")
+    builder.sync(conversation(200))
+    for model in ("falcon-7b-instruct", "llama-7b-chat", "llama-7b-32k"):
+        messages = builder.build(model, "Be kind.", "how are you?")
+        assert sum(message_tokens(message) for message in messages) <= context_budget(model)
+        assert messages[0] == {"role": "system", "content": "Be kind."}
+        assert messages[-1] == {"role": "user", "content": "how are you?"}
+        assert messages[-2]["content"].startswith("turn 199 ")
+    assert len(builder.build("falcon-7b-instruct", "Be kind.", "hi")) < len(builder.build("llama-7b-chat", "Be kind.", "hi"))
+
+def test_turns_take_the_role_of_their_sender():
+    builder = ContextBuilder("alice", "emily")
+    builder.sync(conversation(2))
+    messages = builder.build("llama-7b-chat", "Be kind.", "hi")
+    assert [message["role"] for message in messages] == ["system", "user", "assistant", "user"]
+
+def test_sync_only_adds_new_turns():
+    store = conversation(3)
+    builder = ContextBuilder("alice", "emily")
+    builder.sync(store)
+    store.append({'MNDName': "alice", 'Chatter': "emily", 'Tag': "Family", 'SubTag': "Wife",
+                  'Timestamp': "2024-01-01 10:00:00", 'Message': "new", 'Sender': "emily"})
+    builder.sync(store)
+    assert [message["content"] for message, _ in builder.turns][-1] == "new"
+    assert len(builder.turns) == 4
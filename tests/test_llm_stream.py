@@ -0,0 +1,28 @@
+from llm_stream import FakeLlamaAPI, QuoteStripper, iter_stream_tokens, strip_quotes, strip_quotes_stream
+
+def test_strip_quotes_removes_surrounding_quotes():
+    assert strip_quotes('"Hello there"') == "Hello there"
+    assert strip_quotes("Hello there") == "Hello there"
+    assert strip_quotes("") == ""
+
+def test_quote_stripper_drops_only_the_opening_quote():
+    stripper = QuoteStripper()
+    assert stripper.feed('"') == ""
+    assert stripper.feed('"Hi') == '"Hi'
+
+def test_quote_stripper_holds_back_a_trailing_quote_until_more_text_arrives():
+    stripper = QuoteStripper()
+    assert stripper.feed('She said "hi"') == 'She said "hi'
+    assert stripper.feed(" back") == '" back'
+
+def test_strip_quotes_stream_matches_strip_quotes():
+    tokens = ['"', 'Thanks', ' for', ' the "', 'message', '"', ', talk', ' soon!', '"']
+    streamed = list(strip_quotes_stream(tokens))
+    assert "" not in streamed
+    assert "".join(streamed) == strip_quotes("".join(tokens))
+
+def test_fake_llama_streams_the_reply():
+    llama = FakeLlamaAPI(token_delay=0, first_token_delay=0)
+    tokens = list(iter_stream_tokens(llama, {"model": "llama3-8b", "messages": []}))
+    assert "".join(tokens) == llama.reply
+    assert "".join(strip_quotes_stream(tokens)) == "Thanks for the message, talk soon!"
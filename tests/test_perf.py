@@ -0,0 +1,57 @@
+import json
+from streamlit.testing.v1 import AppTest
+from perf import instrument, percentile, timed
+
+def test_timed_samples_go_to_the_log(tmp_path, monkeypatch):
+    log = tmp_path / "perf.jsonl"
+    monkeypatch.setenv("CHAT_PERF_LOG", str(log))
+    with timed('load') as sample:
+        sample['rows'] = 3
+
+    @instrument('send')
+    def send(message):
+        return message.upper()
+
+    assert send("hi") == "HI"
+    samples = [json.loads(line) for line in log.read_text().splitlines()]
+    assert [(sample['stage'], sample['rows']) for sample in samples] == [('load', 3), ('send', None)]
+    assert all(sample['seconds'] >= 0 for sample in samples)
+
+def test_timed_records_failing_blocks(tmp_path, monkeypatch):
+    log = tmp_path / "perf.jsonl"
+    monkeypatch.setenv("CHAT_PERF_LOG", str(log))
+    try:
+        with timed('fails'):
+            raise ValueError()
+    except ValueError:
+        pass
+    assert json.loads(log.read_text())['stage'] == 'fails'
+
+def test_percentile():
+    values = [5, 1, 4, 2, 3]
+    assert percentile(values, 0) == 1
+    assert percentile(values, 50) == 3
+    assert percentile(values, 100) == 5
+
+def panel_app():
+    import time
+    from perf import perf_panel, timed
+    for _ in range(3):
+        with timed('render') as sample:
+            time.sleep(0.001)
+            sample['rows'] = 10
+    perf_panel()
+
+def test_panel_summarizes_the_session(monkeypatch):
+    monkeypatch.setenv("CHAT_PERF_PANEL", "1")
+    at = AppTest.from_function(panel_app).run()
+    assert not at.exception
+    summary = at.sidebar.dataframe[0].value
+    assert summary['stage'].tolist() == ['render']
+    assert summary['count'].tolist() == [3]
+    assert summary['rows'].tolist() == [10]
+
+def test_panel_is_hidden_by_default(monkeypatch):
+    monkeypatch.delenv("CHAT_PERF_PANEL", raising=False)
+    at = AppTest.from_function(panel_app).run()
+    assert not at.sidebar.expander
@@ -0,0 +1,27 @@
+import json
+from persona import content_hash, parse_bundle, parse_example_chat_msgs, parse_example_mnd_msgs, render_prompt
+
+def test_chat_lines_are_split_on_the_first_colon_only():
+    messages = parse_example_chat_msgs(b'a: b: c\nEmily: "see you at 5:30"\n\nno speaker\n')
+    assert messages == (
+        {"chatter": "a", "content": "b: c"},
+        {"chatter": "Emily", "content": "see you at 5:30"},
+        {"chatter": "", "content": "no speaker"},
+    )
+
+def test_mnd_messages_skip_blank_lines():
+    assert parse_example_mnd_msgs(b"hi\n\n  \nthanks love\n") == ("hi", "thanks love")
+
+def test_bundle_is_keyed_by_upload_contents():
+    persona = json.dumps({"name": "Jack", "traits": ["kind"]}, indent=2).encode("utf-8")
+    bundle = parse_bundle(persona, None, b"hi\n", None)
+    assert bundle.key == (content_hash(persona), None, content_hash(b"hi\n"), None)
+    assert bundle.mnd_persona == '{"name": "Jack", "traits": ["kind"]}'
+    assert bundle.example_chat_msgs is None
+    assert parse_bundle(persona, None, b"hi\n", None) == bundle
+
+def test_prompt_sections_are_trimmed_to_the_budget():
+    bundle = parse_bundle(json.dumps({"bio": "x" * 400}).encode("utf-8"), None, b"\n".join([b"y" * 40] * 10), None)
+    prompt = render_prompt(bundle, section_budget=20)
+    assert "x" * 81 not in prompt
+    assert prompt.count("y" * 40) == 2
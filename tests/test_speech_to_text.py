@@ -0,0 +1,88 @@
+import io
+import time
+import wave
+import pytest
+import speech_recognition as sr
+from speech_to_text import TranscriptionWorker, stub_backend
+
+def make_wav(seconds, rate=8000):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(b"\x00\x00" * int(seconds * rate))
+    return buffer.getvalue()
+
+def wait_for(worker, key, timeout=10):
+    deadline = time.monotonic() + timeout
+    while worker.result(key)['status'] == 'pending':
+        if time.monotonic() > deadline:
+            raise TimeoutError("transcription did not finish")
+        time.sleep(0.01)
+    return worker.result(key)
+
+class FlakyBackend:
+    # Fails with an unreachable service the first time, then answers
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, recognizer, audio):
+        self.calls += 1
+        if self.calls == 1:
+            raise sr.RequestError("service unavailable")
+        return "hello"
+
+def silent_backend(recognizer, audio):
+    raise sr.UnknownValueError()
+
+@pytest.fixture
+def audio():
+    return make_wav(3)
+
+def test_transcribes_every_chunk(audio):
+    worker = TranscriptionWorker(backend=stub_backend, chunk_seconds=1)
+    result = wait_for(worker, worker.submit(audio))
+    assert result['status'] == 'done'
+    assert len(result['chunks']) == 3
+    assert result['text'] == " ".join(result['chunks'])
+    assert result['seconds'] is not None
+
+def test_results_are_cached_by_audio_content(audio):
+    calls = []
+    def backend(recognizer, audio):
+        calls.append(audio)
+        return "hello"
+    worker = TranscriptionWorker(backend=backend, chunk_seconds=10)
+    key = worker.submit(audio)
+    wait_for(worker, key)
+    assert worker.submit(bytes(audio)) == key
+    assert wait_for(worker, key)['text'] == "hello"
+    assert len(calls) == 1
+
+def test_transient_failures_are_retried(audio):
+    backend = FlakyBackend()
+    worker = TranscriptionWorker(backend=backend, chunk_seconds=10)
+    key = worker.submit(audio)
+    result = wait_for(worker, key)
+    assert result['status'] == 'error'
+    assert result['retry']
+    assert worker.submit(audio) == key
+    assert wait_for(worker, key)['text'] == "hello"
+    assert backend.calls == 2
+
+def test_unrecognized_speech_is_not_retried(audio):
+    worker = TranscriptionWorker(backend=silent_backend, chunk_seconds=1)
+    key = worker.submit(audio)
+    result = wait_for(worker, key)
+    assert result['status'] == 'error'
+    assert not result['retry']
+    worker.submit(audio)
+    assert worker.result(key)['status'] == 'error'
+
+def test_cache_is_bounded():
+    worker = TranscriptionWorker(backend=stub_backend, max_cached=2)
+    keys = [worker.submit(make_wav(0.1 * (i + 1))) for i in range(3)]
+    for key in keys[1:]:
+        wait_for(worker, key)
+    assert list(worker.results) == keys[1:]